@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Cache d'authentification pour les pages très HTMX.
+
+Chaque appel HTMX de la grille suivi (edit_mantis, modal_remove, edit_lots...)
+relit l'utilisateur de la session, et chaque appel API relit le Token DRF :
+une requête SQL (voire deux) par appel, des dizaines par minute et par
+utilisateur. On garde ces résultats quelques secondes en mémoire :
+
+- ``CachedAuthenticationMiddleware`` : remplace AuthenticationMiddleware,
+  session -> utilisateur. L'entrée n'est utilisée que si la session contient
+  toujours le même utilisateur et le même hash de mot de passe : une
+  déconnexion ou une session vidée repasse par Django.
+- ``CachedTokenAuthentication`` : remplace TokenAuthentication, token -> utilisateur.
+- ``invalidate_user`` : vide les entrées d'un utilisateur ; appelé au
+  changement de mot de passe (voir le fichier login), à la sauvegarde d'un
+  User (mot de passe, is_active...), à la suppression d'un Token et à la
+  déconnexion.
+- ``get_auth_cache_stats`` / ``auth_cache_api`` : taux de hit et temps
+  d'authentification économisé (estimé : hits x (durée moyenne d'un miss -
+  durée moyenne d'un hit, aller-retour de version partagée compris)).
+
+Les entrées sont gardées en mémoire, par process. Pour qu'une invalidation
+atteigne aussi les autres workers, chaque entrée note la version de
+l'utilisateur lue dans le cache Django partagé (AUTH_CACHE_ALIAS, Redis ou
+Memcached en production) : invalidate_user incrémente cette version et un
+hit dont la version ne correspond plus repasse par la base. Avec un cache
+local (LocMemCache), seul AUTH_CACHE_TTL (5 s par défaut) borne le délai
+pour les autres workers.
+
+settings.py :
+    MIDDLEWARE = [..., "Applications.auth_cache.CachedAuthenticationMiddleware", ...]
+    # à la place de "django.contrib.auth.middleware.AuthenticationMiddleware"
+    REST_FRAMEWORK = {
+        "DEFAULT_AUTHENTICATION_CLASSES": [
+            "Applications.auth_cache.CachedTokenAuthentication",
+            "rest_framework.authentication.SessionAuthentication",
+        ],
+    }
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", ...}}
+    AUTH_CACHE_ALIAS = "default" # cache partagé qui porte les versions par utilisateur
+    AUTH_CACHE_TTL = 5           # secondes, 0 désactive le cache
+    AUTH_CACHE_MAXSIZE = 10000   # entrées par cache (LRU)
+    AUTH_CACHE_ENDPOINT = True   # active /debug/auth-cache/
+    # La session elle-même reste lue à chaque requête : à mettre en cache aussi
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404, JsonResponse
+from django.utils.functional import SimpleLazyObject
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+DEFAULT_TTL = 5
+DEFAULT_MAXSIZE = 10000
+USER_VERSION_KEY = "auth_cache:user:%s"
+
+
+class TTLCache:
+    """LRU à durée de vie courte, thread-safe, avec ses compteurs."""
+
+    def __init__(self, name):
+        self.name = name
+        self._data = OrderedDict()   # clé -> (expiration, user_id, valeur)
+        self._by_user = {}           # user_id -> {clés}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    @property
+    def ttl(self):
+        return getattr(settings, "AUTH_CACHE_TTL", DEFAULT_TTL)
+
+    @property
+    def maxsize(self):
+        return getattr(settings, "AUTH_CACHE_MAXSIZE", DEFAULT_MAXSIZE)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < now:
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, user_id, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, user_id, value)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[1]]
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+            self.hits = self.misses = 0
+            self.miss_seconds = self.hit_seconds = 0.0
+
+    def record(self, hit, seconds=0.0):
+        # Compteurs approximatifs (pas de verrou) : ce ne sont que des stats
+        if hit:
+            self.hits += 1
+            self.hit_seconds += seconds
+        else:
+            self.misses += 1
+            self.miss_seconds += seconds
+
+    def stats(self):
+        total = self.hits + self.misses
+        avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+        avg_hit = self.hit_seconds / self.hits if self.hits else 0.0
+        return OrderedDict([
+            ("size", len(self._data)),
+            ("hits", self.hits),
+            ("misses", self.misses),
+            ("hit_rate", round(self.hits / total, 4) if total else None),
+            ("avg_miss_ms", round(avg_miss * 1000, 3)),
+            ("avg_hit_ms", round(avg_hit * 1000, 3)),
+            # Estimation nette : chaque hit aurait coûté un miss moyen, moins
+            # ce qu'il a coûté (lecture de la version partagée comprise)
+            ("saved_ms", round(self.hits * (avg_miss - avg_hit) * 1000, 1)),
+        ])
+
+
+session_cache = TTLCache("session")
+token_cache = TTLCache("token")
+
+
+def _user_copy(user):
+    # Une copie par requête : une vue qui modifie request.user ne touche pas l'entrée en cache
+    return copy.copy(user)
+
+
+##### Version partagée par utilisateur
+def _shared_cache():
+    return caches[getattr(settings, "AUTH_CACHE_ALIAS", "default")]
+
+
+def get_user_version(user_id):
+    """Version courante de l'utilisateur dans le cache partagé (commune à tous les workers)."""
+    shared = _shared_cache()
+    key = USER_VERSION_KEY % user_id
+    version = shared.get(key)
+    if version is None:
+        # Clé absente (démarrage, éviction) : on repart d'un horodatage en ms
+        # pour ne jamais retomber sur une version notée dans une ancienne entrée
+        shared.add(key, int(time.time() * 1000), timeout=None)
+        version = shared.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    shared = _shared_cache()
+    key = USER_VERSION_KEY % user_id
+    try:
+        shared.incr(key)
+    except ValueError:
+        shared.set(key, int(time.time() * 1000), timeout=None)
+
+
+##### Session -> utilisateur
+def get_cached_user(request):
+    """Équivalent de django.contrib.auth.get_user, avec le cache."""
+    session = request.session
+    session_key = session.session_key
+    user_id = session.get(SESSION_KEY)
+    if session_key is None or user_id is None:
+        return auth.get_user(request)
+
+    session_hash = session.get(HASH_SESSION_KEY)
+    start = time.perf_counter()
+    version = get_user_version(user_id)
+    cached = session_cache.get(session_key)
+    if (cached is not None and cached[0] == (str(user_id), session_hash, version)
+            and cached[1].is_active):
+        session_cache.record(hit=True, seconds=time.perf_counter() - start)
+        return _user_copy(cached[1])
+
+    # Version lue avant la base : une invalidation pendant la lecture
+    # laisse une entrée périmée d'office
+    start = time.perf_counter()
+    user = auth.get_user(request)
+    session_cache.record(hit=False, seconds=time.perf_counter() - start)
+    # get_user a pu vider la session (hash invalide) ou mettre à jour le hash : on relit
+    if user.is_authenticated and session.session_key:
+        if str(user.pk) != str(user_id):
+            version = get_user_version(user.pk)
+        key = (str(user.pk), session.get(HASH_SESSION_KEY), version)
+        session_cache.set(session.session_key, user.pk, (key, user))
+    return user
+
+
+class CachedAuthenticationMiddleware:
+    """Remplace django.contrib.auth.middleware.AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not hasattr(request, "session"):
+            raise RuntimeError("CachedAuthenticationMiddleware doit être placé après SessionMiddleware")
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+        return self.get_response(request)
+
+
+##### Token DRF -> utilisateur
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        start = time.perf_counter()
+        cached = token_cache.get(key)
+        if cached is not None:
+            version, user, token = cached
+            if user.is_active and version == get_user_version(user.pk):
+                token_cache.record(hit=True, seconds=time.perf_counter() - start)
+                return _user_copy(user), token
+
+        start = time.perf_counter()
+        # Lève AuthenticationFailed si le token est inconnu ou l'utilisateur inactif :
+        # les échecs ne sont pas mis en cache
+        user, token = super().authenticate_credentials(key)
+        token_cache.record(hit=False, seconds=time.perf_counter() - start)
+        # Version relue après la base : si une invalidation s'intercale,
+        # l'entrée garde au pire l'ancien utilisateur jusqu'au TTL
+        token_cache.set(key, user.pk, (get_user_version(user.pk), user, token))
+        return _user_copy(user), token
+
+
+##### Invalidation
+def invalidate_user(user):
+    """
+    Vide les entrées session et token d'un utilisateur (ou d'un id) dans ce
+    process, et incrémente sa version partagée pour les autres workers.
+    """
+    user_id = getattr(user, "pk", user)
+    bump_user_version(user_id)
+    session_cache.invalidate_user(user_id)
+    token_cache.invalidate_user(user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, **kwargs):
+    # Mot de passe, is_active, droits... : on relira l'utilisateur
+    invalidate_user(instance)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+    # Les autres workers voient la version changer
+    bump_user_version(instance.user_id)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user)
+
+
+##### Statistiques
+def get_auth_cache_stats():
+    caches = (session_cache, token_cache)
+    hits = sum(c.hits for c in caches)
+    total = hits + sum(c.misses for c in caches)
+    return OrderedDict([
+        ("ttl", session_cache.ttl),
+        ("hit_rate", round(hits / total, 4) if total else None),
+        ("saved_ms", round(sum(c.stats()["saved_ms"] for c in caches), 1)),
+        ("caches", OrderedDict((c.name, c.stats()) for c in caches)),
+    ])
+
+
+def auth_cache_api(request):
+    """Taux de hit du cache d'authentification (JSON), réservé au staff et désactivé par défaut."""
+    if not getattr(settings, "AUTH_CACHE_ENDPOINT", False):
+        raise Http404
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(get_auth_cache_stats())
+
+# urls.py :
+# path("debug/auth-cache/", auth_cache_api, name="debug_auth_cache"),
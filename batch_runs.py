@@ -0,0 +1,583 @@
+# -*- coding: utf-8 -*-
+"""
+Tableau de bord des traitements batch (page f6template).
+
+- ``ingest_executions`` charge en masse les exécutions de traitements et
+  d'étapes (export JSON de l'ordonnanceur, une ligne par exécution) :
+  quelques requêtes par paquet de ``INGEST_BATCH_SIZE`` traitements,
+  rejouable sans doublon (clé : traitement + identifiant d'exécution).
+- Stockage compact : noms de traitements / d'étapes en tables de référence,
+  statut en entier, durée en millisecondes, message d'erreur conservé
+  uniquement pour les étapes en échec (tronqué).
+- ``refresh_step_stats`` tient à jour par étape p50 / p95 des dernières
+  exécutions OK et la tendance par rapport aux exécutions précédentes.
+  Une étape est marquée lente à l'ingestion si elle dépasse le p95 de son
+  historique.
+- ``get_dashboard`` ne renvoie que les étapes en échec ou lentes, paginées
+  et mises en cache (clé versionnée, invalidée à chaque ingestion) : la page
+  s'affiche sans relire des mois d'historique.
+
+Exemple :
+    python manage.py ingest_batch_runs /data/batch/executions_20260318.jsonl
+    cat executions.jsonl | python manage.py ingest_batch_runs -
+
+Format d'une ligne :
+    {"job": "F6_MiseAJourDonneesRefEmpl_SP", "run_id": 18273,
+     "start": "2026-03-18T01:02:00", "end": "2026-03-18T01:25:41", "status": "FAILED",
+     "steps": [{"name": "F6_Maj_Unite_Legale", "status": "FAILED",
+                "start": "2026-03-18T01:06:41", "duration_ms": 1140000,
+                "error": "ORA-00001: unique constraint ..."}]}
+"""
+import json
+import math
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+INGEST_BATCH_SIZE = 500
+ERROR_MAX_LENGTH = 4000
+
+# Statistiques sur les STATS_WINDOW dernières exécutions OK de chaque étape,
+# tendance calculée contre les STATS_WINDOW précédentes
+STATS_WINDOW = 30
+# En dessous de STATS_MIN_SAMPLES exécutions, pas de p95 fiable : jamais "lente"
+STATS_MIN_SAMPLES = 5
+# Une étape de quelques secondes qui dépasse son p95 n'intéresse personne
+SLOW_MIN_MS = 60 * 1000
+
+DASHBOARD_PER_PAGE = 25
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+BATCH_VERSION_KEY = "batch:version"
+
+
+##### models.py
+from django.db import models
+
+STATUS_UNKNOWN = 0
+STATUS_COMPLETED = 1
+STATUS_FAILED = 2
+STATUS_STOPPED = 3
+STATUS_STARTED = 4
+STATUS_ABANDONED = 5
+
+STATUSES = [
+    (STATUS_UNKNOWN, "UNKNOWN"),
+    (STATUS_COMPLETED, "COMPLETED"),
+    (STATUS_FAILED, "FAILED"),
+    (STATUS_STOPPED, "STOPPED"),
+    (STATUS_STARTED, "STARTED"),
+    (STATUS_ABANDONED, "ABANDONED"),
+]
+
+STATUS_CODES = {name: code for code, name in STATUSES}
+STATUS_NAMES = dict(STATUSES)
+# Variantes envoyées par l'ordonnanceur
+STATUS_CODES.update({"STARTING": STATUS_STARTED, "STOPPING": STATUS_STOPPED, "OK": STATUS_COMPLETED, "KO": STATUS_FAILED})
+
+
+class Traitement(models.Model):
+    t_name = models.CharField(max_length=200, unique=True)
+    # Dernière exécution, dénormalisée : le résumé de la page ne lit pas l'historique
+    t_last_run_id = models.BigIntegerField(null=True, blank=True)
+    t_last_start = models.DateTimeField(null=True, blank=True)
+    t_last_status = models.PositiveSmallIntegerField(choices=STATUSES, default=STATUS_UNKNOWN)
+    t_last_duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return self.t_name
+
+
+class Etape(models.Model):
+    e_traitement = models.ForeignKey(Traitement, on_delete=models.CASCADE, related_name="etapes")
+    e_name = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["e_traitement", "e_name"], name="etape_traitement_name"),
+        ]
+
+    def __str__(self):
+        return self.e_name
+
+
+class ExecutionTraitement(models.Model):
+    ex_traitement = models.ForeignKey(Traitement, on_delete=models.CASCADE, related_name="executions")
+    ex_run_id = models.BigIntegerField()
+    ex_start = models.DateTimeField()
+    ex_end = models.DateTimeField(null=True, blank=True)
+    ex_status = models.PositiveSmallIntegerField(choices=STATUSES, default=STATUS_UNKNOWN)
+    ex_duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ex_traitement", "ex_run_id"], name="execution_traitement_run"),
+        ]
+
+
+class ExecutionEtape(models.Model):
+    es_execution = models.ForeignKey(ExecutionTraitement, on_delete=models.CASCADE, related_name="etapes")
+    es_etape = models.ForeignKey(Etape, on_delete=models.CASCADE, related_name="executions")
+    es_start = models.DateTimeField()
+    es_status = models.PositiveSmallIntegerField(choices=STATUSES, default=STATUS_UNKNOWN)
+    es_duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    es_slow = models.BooleanField(default=False)
+    # Vide sauf pour les étapes en échec
+    es_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["es_execution", "es_etape"], name="execution_etape_unique"),
+        ]
+        indexes = [
+            # Historique d'une étape (statistiques)
+            models.Index(fields=["es_etape", "-es_start"], name="execution_etape_start"),
+            # Index partiels : seules les étapes à afficher y sont,
+            # quelques lignes même avec des mois d'historique
+            models.Index(
+                fields=["-es_start"],
+                name="execution_etape_probleme",
+                condition=Q(es_status=STATUS_FAILED) | Q(es_slow=True),
+            ),
+            models.Index(
+                fields=["es_etape", "-es_start"],
+                name="execution_etape_probleme_et",
+                condition=Q(es_status=STATUS_FAILED) | Q(es_slow=True),
+            ),
+        ]
+
+
+class StatEtape(models.Model):
+    se_etape = models.OneToOneField(Etape, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    se_count = models.PositiveIntegerField(default=0)
+    se_p50_ms = models.PositiveIntegerField(null=True, blank=True)
+    se_p95_ms = models.PositiveIntegerField(null=True, blank=True)
+    se_last_ms = models.PositiveIntegerField(null=True, blank=True)
+    # p50 des STATS_WINDOW exécutions précédentes (None si pas assez d'historique)
+    se_prev_p50_ms = models.PositiveIntegerField(null=True, blank=True)
+    se_updated = models.DateTimeField(auto_now=True)
+
+    @property
+    def trend_pct(self):
+        """Évolution du p50 en % par rapport aux exécutions précédentes."""
+        if not self.se_prev_p50_ms or self.se_p50_ms is None:
+            return None
+        return round((self.se_p50_ms - self.se_prev_p50_ms) * 100.0 / self.se_prev_p50_ms, 1)
+
+
+##### Ingestion
+def format_duree(ms):
+    """1140000 -> '19:00', 3723000 -> '1:02:03' (comme l'ancienne carte)."""
+    if ms is None:
+        return ""
+    minutes, seconds = divmod(int(round(ms / 1000.0)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%d:%02d:%02d" % (hours, minutes, seconds)
+    return "%02d:%02d" % (minutes, seconds)
+
+
+def _parse_date(value):
+    if value is None or isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            raise ValueError("date invalide : %r" % (value,))
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _status(value):
+    return STATUS_CODES.get(str(value or "").strip().upper(), STATUS_UNKNOWN)
+
+
+def _duration_ms(record, start, end):
+    if record.get("duration_ms") is not None:
+        return int(record["duration_ms"])
+    if start and end:
+        return max(int((end - start).total_seconds() * 1000), 0)
+    return None
+
+
+def _normalize(record):
+    """Enregistrement JSON -> dict typé (exécution + étapes)."""
+    start = _parse_date(record["start"])
+    end = _parse_date(record.get("end"))
+    # Une étape par nom (la dernière gagne) : l'upsert ne peut pas toucher
+    # deux fois la même ligne ExecutionEtape
+    steps = OrderedDict()
+    for step in record.get("steps") or []:
+        step_start = _parse_date(step.get("start")) or start
+        step_end = _parse_date(step.get("end"))
+        status = _status(step.get("status"))
+        name = step["name"].strip()
+        steps[name] = {
+            "name": name,
+            "start": step_start,
+            "status": status,
+            "duration_ms": _duration_ms(step, step_start, step_end),
+            "error": (step.get("error") or "")[:ERROR_MAX_LENGTH] if status == STATUS_FAILED else "",
+        }
+    return {
+        "job": record["job"].strip(),
+        "run_id": int(record["run_id"]),
+        "start": start,
+        "end": end,
+        "status": _status(record.get("status")),
+        "duration_ms": _duration_ms(record, start, end),
+        "steps": list(steps.values()),
+    }
+
+
+def _dedupe(records):
+    """
+    Une exécution par (job, run_id), la dernière du paquet gagne : sous
+    PostgreSQL, ON CONFLICT DO UPDATE échoue si le même INSERT touche deux
+    fois la même ligne ("cannot affect row a second time").
+    """
+    return list(OrderedDict(((r["job"], r["run_id"]), r) for r in records).values())
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _traitements(names):
+    """{t_name: Traitement} en créant les traitements manquants."""
+    Traitement.objects.bulk_create([Traitement(t_name=name) for name in names], ignore_conflicts=True)
+    return {t.t_name: t for t in Traitement.objects.filter(t_name__in=names)}
+
+
+def _etape_ids(keys):
+    """{(traitement_id, e_name): id} en créant les étapes manquantes."""
+    Etape.objects.bulk_create(
+        [Etape(e_traitement_id=tid, e_name=name) for tid, name in keys], ignore_conflicts=True,
+    )
+    names = {name for _tid, name in keys}
+    tids = {tid for tid, _name in keys}
+    return {
+        (tid, name): pk
+        for pk, tid, name in Etape.objects.filter(e_traitement_id__in=tids, e_name__in=names)
+        .values_list("id", "e_traitement_id", "e_name")
+    }
+
+
+def _is_slow(duration_ms, status, stats):
+    if status != STATUS_COMPLETED or duration_ms is None or stats is None:
+        return False
+    count, p95 = stats
+    return count >= STATS_MIN_SAMPLES and p95 is not None and duration_ms > max(p95, SLOW_MIN_MS)
+
+
+def _ingest_chunk(records):
+    traitements = _traitements({r["job"] for r in records})
+    etape_ids = _etape_ids({(traitements[r["job"]].pk, s["name"]) for r in records for s in r["steps"]})
+
+    # Lenteur jugée par rapport à l'historique, avant d'y ajouter ce paquet
+    history = {
+        pk: (count, p95)
+        for pk, count, p95 in StatEtape.objects.filter(se_etape_id__in=etape_ids.values())
+        .values_list("se_etape_id", "se_count", "se_p95_ms")
+    }
+
+    ExecutionTraitement.objects.bulk_create(
+        [
+            ExecutionTraitement(
+                ex_traitement_id=traitements[r["job"]].pk, ex_run_id=r["run_id"], ex_start=r["start"],
+                ex_end=r["end"], ex_status=r["status"], ex_duration_ms=r["duration_ms"],
+            )
+            for r in records
+        ],
+        update_conflicts=True,
+        unique_fields=["ex_traitement", "ex_run_id"],
+        update_fields=["ex_start", "ex_end", "ex_status", "ex_duration_ms"],
+    )
+    # bulk_create ne renvoie pas les pk en cas de conflit (SQLite, MySQL) : on relit
+    execution_ids = {
+        (tid, run_id): pk
+        for pk, tid, run_id in ExecutionTraitement.objects.filter(
+            ex_traitement_id__in={t.pk for t in traitements.values()},
+            ex_run_id__in={r["run_id"] for r in records},
+        ).values_list("id", "ex_traitement_id", "ex_run_id")
+    }
+
+    lignes = []
+    for r in records:
+        tid = traitements[r["job"]].pk
+        for s in r["steps"]:
+            etape_id = etape_ids[(tid, s["name"])]
+            lignes.append(ExecutionEtape(
+                es_execution_id=execution_ids[(tid, r["run_id"])],
+                es_etape_id=etape_id,
+                es_start=s["start"],
+                es_status=s["status"],
+                es_duration_ms=s["duration_ms"],
+                es_slow=_is_slow(s["duration_ms"], s["status"], history.get(etape_id)),
+                es_error=s["error"],
+            ))
+    ExecutionEtape.objects.bulk_create(
+        lignes,
+        update_conflicts=True,
+        unique_fields=["es_execution", "es_etape"],
+        update_fields=["es_start", "es_status", "es_duration_ms", "es_slow", "es_error"],
+    )
+
+    # Dernière exécution de chaque traitement
+    changed = []
+    for r in sorted(records, key=lambda r: r["start"]):
+        t = traitements[r["job"]]
+        if t.t_last_start is None or r["start"] >= t.t_last_start:
+            t.t_last_run_id = r["run_id"]
+            t.t_last_start = r["start"]
+            t.t_last_status = r["status"]
+            t.t_last_duration_ms = r["duration_ms"]
+            changed.append(t)
+    Traitement.objects.bulk_update(
+        set(changed), ["t_last_run_id", "t_last_start", "t_last_status", "t_last_duration_ms"],
+    )
+
+    refresh_step_stats(set(etape_ids.values()))
+    return {
+        "steps": len(lignes),
+        "failed": sum(1 for l in lignes if l.es_status == STATUS_FAILED),
+        "slow": sum(1 for l in lignes if l.es_slow),
+    }
+
+
+def ingest_executions(records, batch_size=INGEST_BATCH_SIZE):
+    """
+    Charge des exécutions de traitements (itérable de dict, voir le format en
+    tête de fichier). Chaque paquet est dans sa propre transaction : un gros
+    fichier ne bloque pas les tables pendant tout le chargement.
+
+    :return: dict {jobs, steps, failed, slow, seconds}
+    """
+    start = time.perf_counter()
+    stats = {"jobs": 0, "steps": 0, "failed": 0, "slow": 0}
+    for chunk in _chunks((_normalize(r) for r in records), batch_size):
+        chunk = _dedupe(chunk)
+        with transaction.atomic():
+            result = _ingest_chunk(chunk)
+            transaction.on_commit(invalidate_dashboard_cache)
+        stats["jobs"] += len(chunk)
+        for key, value in result.items():
+            stats[key] += value
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+##### Statistiques par étape
+def _percentile(values, pct):
+    """Percentile au rang le plus proche (values triées)."""
+    if not values:
+        return None
+    # Rang ceil(p x n), en base 1 : p95 de 20 valeurs = 19e valeur.
+    # pct x n d'abord, pour que 7 x 100 / 100 reste exactement 7
+    rank = max(math.ceil(pct * len(values) / 100.0) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def refresh_step_stats(etape_ids, window=STATS_WINDOW, batch_size=INGEST_BATCH_SIZE):
+    """
+    Recalcule StatEtape pour les étapes données : une requête (fonction
+    fenêtre) par paquet d'étapes, limitée aux 2 x ``window`` dernières
+    exécutions OK de chacune.
+    """
+    for ids in _chunks(sorted(etape_ids), batch_size):
+        durations = OrderedDict((pk, []) for pk in ids)
+        queryset = (
+            ExecutionEtape.objects
+            .filter(es_etape_id__in=ids, es_status=STATUS_COMPLETED, es_duration_ms__isnull=False)
+            .annotate(rang=Window(
+                RowNumber(),
+                partition_by=[F("es_etape_id")],
+                order_by=[F("es_start").desc(), F("id").desc()],
+            ))
+            .filter(rang__lte=2 * window)
+            .order_by("es_etape_id", "rang")
+            .values_list("es_etape_id", "es_duration_ms")
+        )
+        for pk, duration in queryset:
+            durations[pk].append(duration)
+
+        stats = []
+        for pk, values in durations.items():
+            recent = sorted(values[:window])
+            previous = sorted(values[window:])
+            stats.append(StatEtape(
+                se_etape_id=pk,
+                se_count=len(recent),
+                se_p50_ms=_percentile(recent, 50),
+                se_p95_ms=_percentile(recent, 95),
+                se_last_ms=values[0] if values else None,
+                se_prev_p50_ms=_percentile(previous, 50) if len(previous) >= STATS_MIN_SAMPLES else None,
+                se_updated=timezone.now(),
+            ))
+        StatEtape.objects.bulk_create(
+            stats,
+            update_conflicts=True,
+            unique_fields=["se_etape"],
+            update_fields=["se_count", "se_p50_ms", "se_p95_ms", "se_last_ms", "se_prev_p50_ms", "se_updated"],
+        )
+
+
+##### Cache versionné de la page
+def get_dashboard_version():
+    version = cache.get(BATCH_VERSION_KEY)
+    if version is None:
+        cache.add(BATCH_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(BATCH_VERSION_KEY)
+    return version
+
+
+def invalidate_dashboard_cache(**kwargs):
+    try:
+        cache.incr(BATCH_VERSION_KEY)
+    except ValueError:
+        cache.set(BATCH_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def _step_row(es):
+    stats = getattr(es.es_etape, "stats", None)
+    return {
+        "traitement": es.es_etape.e_traitement.t_name,
+        "etape": es.es_etape.e_name,
+        "run_id": es.es_execution.ex_run_id,
+        "start": es.es_start.isoformat(),
+        "status": STATUS_NAMES[es.es_status],
+        "slow": es.es_slow,
+        "duration": format_duree(es.es_duration_ms),
+        "p50": format_duree(stats.se_p50_ms) if stats else "",
+        "p95": format_duree(stats.se_p95_ms) if stats else "",
+        "trend_pct": stats.trend_pct if stats else None,
+        "error": es.es_error,
+    }
+
+
+def _compute_dashboard(traitement, page, per_page):
+    traitements = [
+        {
+            "name": t.t_name,
+            "status": STATUS_NAMES[t.t_last_status],
+            "run_id": t.t_last_run_id,
+            "start": t.t_last_start.isoformat() if t.t_last_start else None,
+            "duration": format_duree(t.t_last_duration_ms),
+        }
+        for t in Traitement.objects.order_by("t_name")
+    ]
+
+    queryset = (
+        ExecutionEtape.objects
+        .filter(Q(es_status=STATUS_FAILED) | Q(es_slow=True))
+        .select_related("es_etape__e_traitement", "es_etape__stats", "es_execution")
+        .only(
+            "es_start", "es_status", "es_duration_ms", "es_slow", "es_error",
+            "es_execution__ex_run_id",
+            "es_etape__e_name", "es_etape__e_traitement__t_name",
+            "es_etape__stats__se_p50_ms", "es_etape__stats__se_p95_ms", "es_etape__stats__se_prev_p50_ms",
+        )
+        .order_by("-es_start", "-id")
+    )
+    if traitement:
+        queryset = queryset.filter(es_etape__e_traitement__t_name=traitement)
+
+    page_obj = Paginator(queryset, per_page).get_page(page)
+    return {
+        "traitement": traitement,
+        "traitements": traitements,
+        "problemes": [_step_row(es) for es in page_obj],
+        "page": page_obj.number,
+        "num_pages": page_obj.paginator.num_pages,
+        "count": page_obj.paginator.count,
+    }
+
+
+def _dashboard_key(version, traitement, page, per_page):
+    return "batch:dashboard:%s:%s:%s:%s" % (version, traitement or "", page, per_page)
+
+
+def get_dashboard(traitement=None, page=1, per_page=DASHBOARD_PER_PAGE):
+    """
+    Résumé des traitements + une page d'étapes en échec ou lentes,
+    depuis le cache si possible (dict sérialisable).
+    """
+    # "abc", "01", "-3"... : une seule clé par numéro de page réel
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+    version = get_dashboard_version()
+    data = cache.get(_dashboard_key(version, traitement, page, per_page))
+    if data is None:
+        data = _compute_dashboard(traitement, page, per_page)
+        # Page au-delà de la dernière : Paginator renvoie la dernière, mise
+        # en cache sous son propre numéro seulement
+        cache.set(_dashboard_key(version, traitement, data["page"], per_page), data, DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+##### views.py
+def batch_dashboard(request):
+    """Page f6template : ?traitement=F6_MiseAJourDonneesRefEmpl_SP&page=2"""
+    traitement = request.GET.get("traitement") or None
+    data = get_dashboard(traitement, request.GET.get("page") or 1)
+    return render(request, "f6template.html", data)
+
+# urls.py :
+# path("batch/", batch_dashboard, name="batch_dashboard"),
+
+
+##### management/commands/ingest_batch_runs.py
+from django.core.management.base import BaseCommand
+
+
+def iter_json_records(stream):
+    """Une exécution par ligne (JSON Lines), ou un tableau JSON complet."""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == "[":
+        yield from json.loads(first + stream.read())
+        return
+    line = first + stream.readline()
+    while line:
+        if line.strip():
+            yield json.loads(line)
+        line = stream.readline()
+
+
+class Command(BaseCommand):
+    help = "Charge des exécutions de traitements batch (JSON Lines, '-' pour stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            stats = ingest_executions(iter_json_records(sys.stdin), options["batch_size"])
+        else:
+            with open(options["path"], encoding="utf-8") as f:
+                stats = ingest_executions(iter_json_records(f), options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            "%(jobs)d exécution(s), %(steps)d étape(s) dont %(failed)d en échec "
+            "et %(slow)d lente(s) en %(seconds).1f s" % stats
+        ))
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de mesure des requêtes suivi / cartographie.
+
+- ``seed_suivi_dataset`` remplit une base jetable (SQLite ou PostgreSQL local)
+  avec des volumes réalistes : de 1 000 à 1 000 000 d'installations, les lots
+  et versions qui vont avec, les SuiviLotVersion et la table Cartographie.
+  Les lignes sont créées par paquets : la mémoire ne dépend pas du volume.
+- ``run_benchmarks`` mesure chaque fonction (temps, nombre de requêtes,
+  pic mémoire Python) et compare à une référence enregistrée en JSON :
+  une régression est signalée avant la mise en production.
+
+Exemple :
+    python manage.py seed_suivi --installs 100000
+    python manage.py bench_suivi --save            # enregistre la référence
+    python manage.py bench_suivi                   # compare à la référence
+"""
+import io
+import json
+import os
+import random
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+# Adapte les imports selon l'organisation de ton application
+from .models import Contexte, Lot, Statut, SuiviInstall, SuiviLotVersion
+from .instrumentation import track_queries
+from .suivi import (
+    CARTO_STATUTS, STATUT_ORDER_DEFAULT, STATUT_SORT_ORDERS,
+    ecrire_export_mantis, get_cartographie_from_carto, get_cartographie_reference,
+    get_cartographie_single_pass, get_installations_stats, get_installations_with_lots_json,
+    iter_installations_chunks, phase_for_status_name, rebuild_cartographie,
+    refresh_phase_dates, version_sort_key,
+)
+
+SEED_BATCH_SIZE = 5000
+BASELINE_PATH = "bench_baseline.json"
+
+# Statuts créés par le jeu de données : pk -> nom (CARTO_STATUTS inclus)
+SEED_STATUTS = OrderedDict([
+    (1, "en attente"),
+    (2, "Terminé"),
+    (3, "a faire"),
+    (4, "en cours"),
+    (5, "Analyse en cours"),
+    (6, "Installation en cours"),
+    (7, "A tester"),
+    (11, "Validation à cartographier"),
+    (12, "Livré"),
+    (14, "terminée"),
+])
+
+# Écart toléré par rapport à la référence avant de parler de régression
+TIME_TOLERANCE = 0.20
+MEMORY_TOLERANCE = 0.20
+
+
+##### Jeu de données
+def _bulk(model, objs, batch_size):
+    return model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def seed_suivi_dataset(nb_installs=10000, nb_contextes=40, lots_par_install=(1, 8), seed=42,
+                       batch_size=SEED_BATCH_SIZE, verbose=True):
+    """
+    Génère un jeu de données reproductible (même ``seed`` = mêmes lignes).
+    À lancer sur une base vide / jetable.
+
+    :param nb_installs: Nombre de SuiviInstall (1 000 à 1 000 000)
+    :param nb_contextes: Nombre de contextes (répartis sur Contexte.CATEGORY)
+    :param lots_par_install: (min, max) lots par installation
+    :return: dict des volumes créés
+    """
+    start = time.perf_counter()
+    rnd = random.Random(seed)
+    now = timezone.now()
+    nb_noms = min(max(nb_installs // 50, 50), 5000)
+    codes = [code for code, _label in Contexte.CATEGORY]
+    stats = {"contextes": nb_contextes, "lots": 0, "installs": 0, "lots_installs": 0, "versions": 0}
+
+    with transaction.atomic():
+        for pk, name in SEED_STATUTS.items():
+            Statut.objects.update_or_create(pk=pk, defaults={
+                "s_name": name,
+                "s_phase": phase_for_status_name(name),
+                "s_sort_order": STATUT_SORT_ORDERS.get(name, STATUT_ORDER_DEFAULT),
+            })
+        statuts = list(Statut.objects.filter(pk__in=SEED_STATUTS).values_list("pk", "s_sort_order"))
+
+        contexte_ids = [c.pk for c in _bulk(Contexte, [
+            Contexte(c_name="ENV%03d" % i, c_category=codes[i % len(codes)])
+            for i in range(nb_contextes)
+        ], batch_size)]
+
+        # Chaque lot a 1 à 8 versions croissantes (9.2.2 < 9.2.10 volontairement)
+        versions = []
+        for i in range(nb_noms):
+            majeur, mineur, patch = rnd.randint(1, 15), rnd.randint(0, 5), 0
+            for _v in range(rnd.randint(1, 8)):
+                patch += rnd.randint(1, 6)
+                version = "%d.%d.%d" % (majeur, mineur, patch)
+                versions.append(Lot(l_name="Lot %04d" % i, l_version=version, l_version_key=version_sort_key(version)))
+        _bulk(Lot, versions, batch_size)
+        stats["lots"] = len(versions)
+
+        # nom -> [id, ...] dans l'ordre des versions
+        lots = OrderedDict()
+        for pk, name in Lot.objects.filter(l_name__startswith="Lot ").order_by("l_name", "l_version_key", "pk") \
+                .values_list("pk", "l_name"):
+            lots.setdefault(name, []).append(pk)
+        noms = list(lots)
+
+    Through = SuiviInstall.su_lots.through
+    mantis = (SuiviInstall.objects.order_by("-su_mantis").values_list("su_mantis", flat=True).first() or 40000) + 1
+    for offset in range(0, nb_installs, batch_size):
+        with transaction.atomic():
+            installs = []
+            for i in range(offset, min(offset + batch_size, nb_installs)):
+                statut_id, sort_order = rnd.choice(statuts)
+                reception = now - timedelta(days=rnd.randint(0, 1100), minutes=rnd.randint(0, 1440))
+                livre = statut_id in CARTO_STATUTS
+                installs.append(SuiviInstall(
+                    su_mantis=mantis + i,
+                    su_contexte_id=rnd.choice(contexte_ids),
+                    su_statut_id=statut_id,
+                    su_statut_order=sort_order,
+                    su_type_installation=rnd.choice(("Standard", "Urgente", "Corrective")),
+                    su_reception_date=reception,
+                    su_taken_date=reception + timedelta(days=rnd.randint(0, 3)),
+                    su_analyse_date=reception + timedelta(days=rnd.randint(1, 5)),
+                    su_desired_delivery_date=reception + timedelta(days=rnd.randint(5, 40)),
+                    su_delivery_date=reception + timedelta(days=rnd.randint(3, 60)) if livre else None,
+                ))
+            installs = _bulk(SuiviInstall, installs, batch_size)
+
+            liens, suivis = [], []
+            for inst in installs:
+                for nom in rnd.sample(noms, rnd.randint(*lots_par_install)):
+                    rang = rnd.randrange(len(lots[nom]))
+                    liens.append(Through(suiviinstall_id=inst.pk, lot_id=lots[nom][rang]))
+                    suivis.append(SuiviLotVersion(
+                        si_lot_id=lots[nom][rang],
+                        si_installation_mantis=inst.su_mantis,
+                        si_is_new_lot=rang == 0,
+                        si_updated_artefact_number=rnd.randint(0, 30),
+                        si_precedent_id=lots[nom][rang - 1] if rang else None,
+                    ))
+            _bulk(Through, liens, batch_size)
+            _bulk(SuiviLotVersion, suivis, batch_size)
+
+        stats["installs"] += len(installs)
+        stats["lots_installs"] += len(liens)
+        stats["versions"] += len(suivis)
+        if verbose:
+            print("%8d / %d installations" % (stats["installs"], nb_installs))
+
+    # Champs dénormalisés : bulk_create ne passe pas par les signaux
+    refresh_phase_dates()
+    rebuild_cartographie()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+##### Fonctions mesurées
+def export_prefetch():
+    """Ancien export (Prefetch des lots, contexte / statut lus par ligne)."""
+    queryset = SuiviInstall.objects.prefetch_related(
+        Prefetch("su_lots", queryset=Lot.objects.only("l_name", "l_version"))
+    )
+    return [
+        {
+            "mantis": inst.su_mantis,
+            "context": inst.su_contexte.c_name if inst.su_contexte else None,
+            "statut": inst.su_statut.s_name if inst.su_statut else None,
+            "lots_version": ", ".join("%s@%s" % (lot.l_name, lot.l_version) for lot in inst.su_lots.all()),
+        }
+        for inst in queryset
+    ]
+
+
+BENCHMARKS = OrderedDict([
+    ("get_cartographie_reference", get_cartographie_reference),
+    ("get_cartographie_single_pass", get_cartographie_single_pass),
+    ("get_cartographie_from_carto", lambda: [get_cartographie_from_carto(code) for code, _l in Contexte.CATEGORY]),
+    ("get_installations_stats", get_installations_stats),
+    ("get_installations_with_lots_json", get_installations_with_lots_json),
+    ("export_prefetch", export_prefetch),
+    ("export_listing", lambda: sum(len(chunk) for chunk in iter_installations_chunks())),
+    ("export_mantis_xlsx", lambda: ecrire_export_mantis(io.BytesIO())),
+])
+
+
+##### Mesure
+def measure(func, repeat=3):
+    """
+    Mesure une fonction : meilleur temps sur ``repeat`` exécutions, nombre de
+    requêtes, puis pic mémoire Python sur une exécution à part
+    (tracemalloc ralentit l'exécution, il fausserait le temps).
+
+    :return: dict {seconds, queries, peak_kb} ou {error}
+    """
+    try:
+        durations = []
+        for _ in range(repeat):
+            with track_queries(using=connection.alias) as stats:
+                func()
+            durations.append(stats.seconds)
+
+        tracemalloc.start()
+        try:
+            func()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    except Exception as e:  # une fonction cassée ne doit pas arrêter le banc
+        return {"error": "%s: %s" % (type(e).__name__, e)}
+
+    return {
+        "seconds": round(min(durations), 4),
+        "queries": stats.queries,
+        "peak_kb": peak // 1024,
+    }
+
+
+def dataset_label():
+    """Clé de la référence : moteur + volume (une référence par jeu de données)."""
+    return "%s-%d" % (connection.vendor, SuiviInstall.objects.count())
+
+
+def compare(result, reference):
+    """Liste des régressions d'une mesure par rapport à sa référence."""
+    if "error" in result:
+        return ["erreur : %s" % result["error"]]
+    if not reference or "error" in reference:
+        return []
+    regressions = []
+    if result["queries"] > reference["queries"]:
+        regressions.append("requêtes %d -> %d" % (reference["queries"], result["queries"]))
+    if result["seconds"] > reference["seconds"] * (1 + TIME_TOLERANCE):
+        regressions.append("temps %.3f s -> %.3f s" % (reference["seconds"], result["seconds"]))
+    if result["peak_kb"] > reference["peak_kb"] * (1 + MEMORY_TOLERANCE):
+        regressions.append("mémoire %d Ko -> %d Ko" % (reference["peak_kb"], result["peak_kb"]))
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmarks(names=None, repeat=3, baseline_path=BASELINE_PATH, save=False, verbose=True):
+    """
+    Mesure les fonctions de BENCHMARKS et les compare à la référence.
+
+    :param names: Sous-ensemble de BENCHMARKS (None = toutes)
+    :param save: Enregistre les mesures comme nouvelle référence pour ce jeu de données
+    :return: (mesures, régressions) où régressions = {nom: [message, ...]}
+    """
+    label = dataset_label()
+    baseline = load_baseline(baseline_path)
+    reference = baseline.get(label, {})
+
+    results, regressions = OrderedDict(), OrderedDict()
+    for name, func in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure(func, repeat)
+        problems = compare(results[name], reference.get(name))
+        if problems:
+            regressions[name] = problems
+
+        if verbose:
+            r = results[name]
+            if "error" in r:
+                print("%-34s ERREUR %s" % (name, r["error"]))
+            else:
+                print("%-34s %9.1f ms  %5d requête(s)  %8d Ko%s" % (
+                    name, r["seconds"] * 1000, r["queries"], r["peak_kb"],
+                    "  ⚠ " + ", ".join(problems) if problems else "",
+                ))
+
+    if save:
+        baseline[label] = results
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if verbose:
+        print("%s : %d régression(s)%s" % (
+            label, len(regressions), " (référence enregistrée)" if save else "" if reference else " (pas de référence)"
+        ))
+    return results, regressions
+
+
+##### Commandes
+# management/commands/seed_suivi.py :
+#     from Applications.benchmark import SeedSuiviCommand as Command
+# management/commands/bench_suivi.py :
+#     from Applications.benchmark import BenchSuiviCommand as Command
+from django.core.management.base import BaseCommand
+
+
+class SeedSuiviCommand(BaseCommand):
+    help = "Remplit une base jetable avec un jeu de données suivi / cartographie"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--installs", type=int, default=10000)
+        parser.add_argument("--contextes", type=int, default=40)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stats = seed_suivi_dataset(
+            nb_installs=options["installs"],
+            nb_contextes=options["contextes"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "%(installs)d installation(s), %(lots)d lot(s), %(lots_installs)d lien(s), "
+            "%(versions)d SuiviLotVersion en %(seconds).1f s" % stats
+        ))
+
+
+class BenchSuiviCommand(BaseCommand):
+    help = "Mesure les requêtes suivi / cartographie et compare à la référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Fonctions à mesurer (défaut : toutes)")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--baseline", default=BASELINE_PATH)
+        parser.add_argument("--save", action="store_true", help="Enregistre les mesures comme référence")
+
+    def handle(self, *args, **options):
+        _results, regressions = run_benchmarks(
+            names=options["names"],
+            repeat=options["repeat"],
+            baseline_path=options["baseline"],
+            save=options["save"],
+        )
+        if regressions and not options["save"]:
+            raise SystemExit(1)
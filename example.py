@@ -35,6 +35,9 @@ def modify_log4j_levels(xml_path, new_level, output_path=None):
 
     tree.write(output_path, encoding='utf-8', xml_declaration=True)
 
+# Pour traiter tout un dossier (ou un glob) de log4j2.xml en parallèle,
+# en streaming et avec écriture atomique : voir log4j.py
+
 # --- Exemple d'utilisation ---
 if __name__ == "__main__":
     modify_log4j_levels("log4j2.xml", "WARN")
@@ -57,7 +60,7 @@ def get_cartographie():
                 su_lots=OuterRef('su_lots'),
             )
             .values('su_lots')
-            .annotate(max_version=Max('su_lots__l_version'))
+            .annotate(max_version=Max('su_lots__l_version_key'))
             .values('max_version')[:1]
         )
 
@@ -94,10 +97,10 @@ def get_cartographie():
             if contexte_name not in cartographie:
                 cartographie[contexte_name] = OrderedDict()
 
-            # On garde la version la plus haute
+            # On garde la version la plus haute (comparaison numérique : 9.2.10 > 9.2.2)
             if (
                 lot_name not in cartographie[contexte_name]
-                or version > cartographie[contexte_name][lot_name]["Version"]
+                or parse_version(version) > parse_version(cartographie[contexte_name][lot_name]["Version"])
             ):
                 cartographie[contexte_name][lot_name] = {
                     "Version": version,
@@ -110,57 +113,351 @@ def get_cartographie():
     return cartographie
 
 
+########
+# Versions de lot comparables ("9.2.10" > "9.2.2")
+# l_version est un texte : comparé tel quel, "9.2.10" < "9.2.2".
+# On stocke donc sur Lot une clé triable (chaque nombre complété par des
+# zéros) : l'ordre alphabétique de la clé est l'ordre des versions, la base
+# peut trier / faire un MAX dessus, et un index (l_name, l_version_key)
+# sert directement "dernière version de chaque lot".
+from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from .models import Lot
+
+# parse_version / version_sort_key : voir suivi.py
+from .suivi import VERSION_KEY_LENGTH, parse_version, version_sort_key
+
+
+##### models.py
+# class Lot(models.Model):
+#     ...
+#     l_version_key = models.CharField(max_length=VERSION_KEY_LENGTH, default="", editable=False)
+#
+#     class Meta:
+#         indexes = [
+#             models.Index(fields=["l_name", "l_version_key"], name="lot_name_version_key"),
+#         ]
+
+
+def latest_lots(queryset=None):
+    """
+    Dernière version de chaque lot (par l_name), choisie par la base
+    via l'index lot_name_version_key.
+
+    :return: queryset de Lot (un par l_name, ou plusieurs si même clé de version)
+    """
+    if queryset is None:
+        queryset = Lot.objects.all()
+    derniere_cle = (
+        Lot.objects
+        .filter(l_name=OuterRef("l_name"))
+        .order_by("-l_version_key")
+        .values("l_version_key")[:1]
+    )
+    return queryset.filter(l_version_key=Subquery(derniere_cle))
+
+
+##### signals.py
+# bulk_create ne passe pas par ce signal : renseigner l_version_key=version_sort_key(...)
+@receiver(pre_save, sender=Lot)
+def set_version_key(sender, instance, **kwargs):
+    instance.l_version_key = version_sort_key(instance.l_version)
+
+
+##### migrations/00XX_lot_version_key.py
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def backfill_version_key(apps, schema_editor):
+    Lot = apps.get_model("Applications", "Lot")
+    a_modifier = []
+    for lot in Lot.objects.only("pk", "l_version").iterator(chunk_size=BATCH_SIZE):
+        lot.l_version_key = version_sort_key(lot.l_version)
+        a_modifier.append(lot)
+        if len(a_modifier) >= BATCH_SIZE:
+            Lot.objects.bulk_update(a_modifier, ["l_version_key"])
+            a_modifier = []
+    Lot.objects.bulk_update(a_modifier, ["l_version_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Applications", "00XX_previous"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="l_version_key",
+            field=models.CharField(max_length=VERSION_KEY_LENGTH, default="", editable=False),
+        ),
+        migrations.RunPython(backfill_version_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="lot",
+            index=models.Index(fields=["l_name", "l_version_key"], name="lot_name_version_key"),
+        ),
+    ]
+
+
+########
+# Cartographie en une seule requête (remplace la boucle par catégorie)
+# get_cartographie_single_pass() et sa référence Python : voir suivi.py
+from django.db import connection
+from django.db.models import F
+
+from .suivi import CARTO_STATUTS, get_cartographie_reference, get_cartographie_single_pass
+
+
+# --- Benchmark ancien / nouveau chemin sur un jeu de données généré ---
+import random
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+def seed_cartographie_dataset(nb_contextes=40, nb_lots=300, nb_installs=20000, lots_par_install=5, seed=42):
+    """
+    Génère un jeu de données de test (à lancer sur une base jetable).
+    """
+    rnd = random.Random(seed)
+    Lot = SuiviInstall._meta.get_field("su_lots").related_model
+    Statut = SuiviInstall._meta.get_field("su_statut").related_model
+    codes = [code for code, _label in Contexte.CATEGORY]
+    now = timezone.now()
+
+    with transaction.atomic():
+        for pk in CARTO_STATUTS + [1, 3]:
+            Statut.objects.get_or_create(pk=pk, defaults={"s_name": "statut %d" % pk})
+        statut_ids = list(Statut.objects.values_list("pk", flat=True))
+
+        contextes = Contexte.objects.bulk_create([
+            Contexte(c_name="ENV%03d" % i, c_category=codes[i % len(codes)])
+            for i in range(nb_contextes)
+        ])
+        lots = Lot.objects.bulk_create([
+            Lot(l_name="Lot %03d" % (i % nb_lots), l_version=version, l_version_key=version_sort_key(version))
+            for i, version in enumerate(
+                "9.%d.%d" % (i // nb_lots, rnd.randint(0, 20)) for i in range(nb_lots * 5)
+            )
+        ])
+        installs = SuiviInstall.objects.bulk_create([
+            SuiviInstall(
+                su_mantis=40000 + i,
+                su_contexte=rnd.choice(contextes),
+                su_statut_id=rnd.choice(statut_ids),
+                su_delivery_date=now - timedelta(days=rnd.randint(0, 1500)),
+            )
+            for i in range(nb_installs)
+        ], batch_size=2000)
+
+        Through = SuiviInstall.su_lots.through
+        Through.objects.bulk_create([
+            Through(suiviinstall_id=inst.pk, lot_id=lot.pk)
+            for inst in installs
+            for lot in rnd.sample(lots, lots_par_install)
+        ], batch_size=5000, ignore_conflicts=True)
+
+
+def bench_get_cartographie(repeat=3):
+    """
+    Compare get_cartographie_single_pass() à la référence Python :
+    temps moyen, nombre de requêtes, et vérifie que les résultats sont identiques.
+
+    get_cartographie() n'est pas mesurée : elle échoue en l'état
+    (OuterRef sur su_contexte_id dans la sous-requête) et ne peut pas
+    servir de référence.
+    """
+    results = {}
+    for func in (get_cartographie_reference, get_cartographie_single_pass):
+        durations = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                carto = func()
+                durations.append(time.perf_counter() - start)
+        results[func.__name__] = carto
+        print("%-32s %8.1f ms  %4d requête(s)" % (
+            func.__name__, 1000 * sum(durations) / repeat, len(ctx.captured_queries)
+        ))
+
+    reference, new = results["get_cartographie_reference"], results["get_cartographie_single_pass"]
+    print("Résultats identiques :", reference == new)
+
 
 №########
 
 from django.db import models
-from datetime import datetime
-import locale
+from datetime import date, datetime
+from functools import lru_cache
+import time
+import unicodedata
+
+# Noms de mois en dur : plus de locale.setlocale (global au process,
+# pas thread-safe, et faux en silence sur un serveur sans fr_FR)
+MOIS_FR = (
+    "Janvier", "Février", "Mars", "Avril", "Mai", "Juin",
+    "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre",
+)
+
+
+def _sans_accent(texte):
+    return unicodedata.normalize("NFKD", texte).encode("ascii", "ignore").decode().lower()
+
+
+# 'fevrier', 'février', 'Février' → 2
+_MOIS_INDEX = {_sans_accent(nom): i for i, nom in enumerate(MOIS_FR, start=1)}
+
 
-# Force la locale française pour les noms de mois
-try:
-    locale.setlocale(locale.LC_TIME, "fr_FR.UTF-8")
-except locale.Error:
-    # Sur Windows ou serveurs sans locale FR, on peut gérer manuellement
-    pass
+@lru_cache(maxsize=4096)
+def format_month_year(yyyymm):
+    """202511 → 'Novembre 2025'. Lève ValueError si le mois n'est pas entre 1 et 12."""
+    annee, mois = divmod(int(yyyymm), 100)
+    if not 1 <= mois <= 12:
+        # 202500 donnerait MOIS_FR[-1] = 'Décembre' sans ce contrôle
+        raise ValueError("Mois invalide : %r" % yyyymm)
+    return "%s %d" % (MOIS_FR[mois - 1], annee)
 
-class MonthYearField(models.CharField):
+
+@lru_cache(maxsize=4096)
+def parse_month_year(value):
+    """
+    Texte → entier AAAAMM.
+    Formats acceptés : '2025-11', '11/2025', '202511', 'Novembre 2025', 'novembre 2025'.
+    Lève ValueError si le format est inconnu.
+    """
+    texte = value.strip()
+    if texte.isdigit() and len(texte) == 6:
+        annee, mois = int(texte[:4]), int(texte[4:])
+    elif len(texte) == 7 and texte[4] == "-":
+        annee, mois = int(texte[:4]), int(texte[5:])
+    elif len(texte) == 7 and texte[2] == "/":
+        annee, mois = int(texte[3:]), int(texte[:2])
+    else:
+        nom, _, annee = texte.rpartition(" ")
+        mois = _MOIS_INDEX.get(_sans_accent(nom.strip()))
+        if mois is None or not annee.isdigit():
+            raise ValueError("Mois-année invalide : %r" % value)
+        annee = int(annee)
+
+    if not 1 <= mois <= 12:
+        raise ValueError("Mois invalide : %r" % value)
+    return annee * 100 + mois
+
+
+class MonthYearField(models.IntegerField):
     """
-    Champ personnalisé pour stocker YYYY-MM
-    et afficher Mois Année en français (ex: 'Novembre 2025')
+    Champ mois-année stocké en entier AAAAMM (compact et triable)
+    et affiché en français (ex: 'Novembre 2025')
     """
-    description = "Champ mois-année au format texte (YYYY-MM)"
+    description = "Champ mois-année (entier AAAAMM)"
 
-    def __init__(self, *args, **kwargs):
-        kwargs["max_length"] = 7  # ex: "2025-11"
-        super().__init__(*args, **kwargs)
+    def from_db_value(self, value, expression, connection):
+        """Valeur DB (202511) → 'Novembre 2025'"""
+        if value is None:
+            return None
+        return format_month_year(value)
 
     def to_python(self, value):
-        """Convertit la valeur DB en texte affichable"""
-        if not value:
+        """Convertit n'importe quelle saisie en texte affichable"""
+        if value in (None, ""):
             return None
-        if isinstance(value, datetime):
-            return value.strftime("%Y-%m")
-        # Si c’est une chaîne '2025-11' → 'Novembre 2025'
+        if isinstance(value, (date, datetime)):
+            return format_month_year(value.year * 100 + value.month)
         try:
-            date_obj = datetime.strptime(value, "%Y-%m")
-            return date_obj.strftime("%B %Y").capitalize()
-        except ValueError:
+            if isinstance(value, int):
+                return format_month_year(value)
+            return format_month_year(parse_month_year(value))
+        except (ValueError, IndexError):
             return value
 
     def get_prep_value(self, value):
-        """Avant d’enregistrer, on convertit 'Novembre 2025' en '2025-11'"""
-        if not value:
+        """Avant d'enregistrer : 'Novembre 2025', '2025-11', date... → 202511"""
+        if value in (None, ""):
             return None
-        # Si déjà au bon format, on laisse
-        if isinstance(value, str) and len(value) == 7 and "-" in value:
-            return value
-        # Conversion du texte français → format YYYY-MM
-        try:
-            date_obj = datetime.strptime(value, "%B %Y")
-            return date_obj.strftime("%Y-%m")
-        except ValueError:
+        if isinstance(value, (date, datetime)):
+            return value.year * 100 + value.month
+        if isinstance(value, int):
             return value
+        return parse_month_year(value)
+
+
+##### migrations/00XX_month_year_int.py
+# Passage de l'ancien CharField 'YYYY-MM' à l'entier AAAAMM
+from django.db import migrations
+from Applications.fields import MonthYearField, parse_month_year  # adapte selon ton projet
+
+MODEL_NAME = "indicateur"   # adapte selon ton modèle
+FIELD_NAME = "i_mois"       # adapte selon ton champ
+BATCH_SIZE = 2000
+
+
+def texte_vers_entier(apps, schema_editor):
+    Model = apps.get_model("Applications", MODEL_NAME)
+    # Lecture brute de la colonne texte : si le modèle historique porte déjà
+    # un MonthYearField, passer par l'ORM appellerait from_db_value("2025-11")
+    # Lecture paginée par clé primaire : BATCH_SIZE lignes en mémoire au plus
+    qn = schema_editor.quote_name
+    pk_column = qn(Model._meta.pk.column)
+    column = qn(Model._meta.get_field(FIELD_NAME).column)
+    sql = "SELECT %s, %s FROM %s WHERE %s IS NOT NULL AND %s > %%s ORDER BY %s LIMIT %d" % (
+        pk_column, column, qn(Model._meta.db_table), column, pk_column, pk_column, BATCH_SIZE,
+    )
+    dernier_pk = 0
+    while True:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(sql, [dernier_pk])
+            lignes = cursor.fetchall()
+        if not lignes:
+            break
+        a_modifier = [
+            Model(pk=pk, **{FIELD_NAME + "_int": parse_month_year(str(texte))})
+            for pk, texte in lignes
+        ]
+        Model.objects.bulk_update(a_modifier, [FIELD_NAME + "_int"])
+        dernier_pk = lignes[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Applications", "00XX_previous"),
+    ]
+
+    operations = [
+        migrations.AddField(MODEL_NAME, FIELD_NAME + "_int", models.IntegerField(null=True)),
+        migrations.RunPython(texte_vers_entier, migrations.RunPython.noop),
+        migrations.RemoveField(MODEL_NAME, FIELD_NAME),
+        migrations.RenameField(MODEL_NAME, FIELD_NAME + "_int", FIELD_NAME),
+        migrations.AlterField(MODEL_NAME, FIELD_NAME, MonthYearField(null=True, db_index=True)),
+    ]
+
+
+##### benchmark
+def bench_month_year(nb=100000):
+    """Chargement de ``nb`` valeurs : ancien strptime/strftime vs table + cache."""
+    valeurs_texte = ["%d-%02d" % (2015 + i % 10, 1 + i % 12) for i in range(nb)]
+    valeurs_int = [(2015 + i % 10) * 100 + 1 + i % 12 for i in range(nb)]
+    field = MonthYearField()
+
+    start = time.perf_counter()
+    for v in valeurs_texte:
+        datetime.strptime(v, "%Y-%m").strftime("%B %Y").capitalize()
+    ancien = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for v in valeurs_int:
+        field.from_db_value(v, None, None)
+    nouveau = time.perf_counter() - start
+
+    print("strptime/strftime : %7.1f ms" % (ancien * 1000))
+    print("table + lru_cache : %7.1f ms (x%.0f)" % (nouveau * 1000, ancien / nouveau))
 
 
 ####
@@ -195,67 +492,240 @@ qs = (
 
 
 #######
-from django.db.models import Count, Q, F
+# Statistiques mensuelles en une requête (GroupConcat, get_installations_stats) : voir suivi.py
+from django.db.models import Count, F, Q
 from django.db.models.functions import TruncMonth
+from .suivi import parse_tickets, tickets_ko_aggregate
 
-from django.db.models import Count, Q, F
-from django.db.models.functions import TruncMonth
 
-def get_installations_stats():
-    """
-    Retourne un dictionnaire des installations par mois :
-    {
-        '2025-01': {'ok': 12, 'ko': 3, 'tickets_ko': [1234, 1237, 1240]},
-        '2025-02': {'ok': 9,  'ko': 1, 'tickets_ko': [1302]},
-        ...
-    }
-    """
-    from .models import SuiviInstallation  # adapte selon ton modèle
+#######
+# Rollup mensuel des délais de livraison (par contexte et type)
+# Les dashboards lisent cette petite table au lieu d'agréger tous les
+# SuiviInstall à chaque requête. Elle est tenue à jour par signaux
+# (seuls les "seaux" mois/contexte/type touchés sont recalculés) et
+# peut être reconstruite avec la commande backfill_delais_mensuels.
+from datetime import datetime
 
-    # Filtrage principal : statuts terminés ou à cartographier
-    queryset = SuiviInstallation.objects.filter(
-        su_statut__in=["Terminé", "Validation à cartographier"],
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+DELAI_STATUTS = ["Terminé", "Validation à cartographier"]
+
+
+##### models.py
+class DelaiMensuel(models.Model):
+    dm_mois = models.DateField()  # 1er jour du mois
+    dm_contexte = models.ForeignKey("Contexte", on_delete=models.CASCADE)
+    dm_type = models.CharField(max_length=50, blank=True, default="")
+    dm_ok = models.PositiveIntegerField(default=0)
+    dm_ko = models.PositiveIntegerField(default=0)
+    dm_tickets_ko = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dm_mois", "dm_contexte", "dm_type"], name="uniq_delai_mensuel"),
+        ]
+        indexes = [models.Index(fields=["dm_mois"])]
+
+
+##### rollup
+def _mois(value):
+    """Premier jour du mois (dans le fuseau courant) d'une date/datetime."""
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        value = value.date()
+    return value.replace(day=1)
+
+
+def _bornes_mois(mois):
+    """[début, fin[ du mois, en datetimes comparables à su_delivery_date."""
+    debut = datetime(mois.year, mois.month, 1)
+    fin = datetime(mois.year + mois.month // 12, mois.month % 12 + 1, 1)
+    if settings.USE_TZ:
+        debut, fin = timezone.make_aware(debut), timezone.make_aware(fin)
+    return debut, fin
+
+
+def _installs_delai():
+    return SuiviInstall.objects.filter(
+        su_statut__s_name__in=DELAI_STATUTS,
         su_delivery_date__isnull=False,
-        su_desired_delivery_date__isnull=False
+        su_desired_delivery_date__isnull=False,
     )
 
-    # Agrégation mensuelle de base
+
+def _agregats_delai():
+    hors_delai = Q(su_delivery_date__gt=F("su_desired_delivery_date"))
+    return {
+        "ok": Count("id", filter=Q(su_delivery_date__lte=F("su_desired_delivery_date"))),
+        "ko": Count("id", filter=hors_delai),
+        "tickets_ko": tickets_ko_aggregate(hors_delai),
+    }
+
+
+def refresh_delais_mensuels(seaux):
+    """
+    Recalcule les seaux (mois, contexte_id, type) donnés : une petite
+    requête indexée par seau, puis upsert ou suppression de la ligne.
+    """
+    for mois, contexte_id, type_installation in set(seaux):
+        debut, fin = _bornes_mois(mois)
+        agg = _installs_delai().filter(
+            su_contexte_id=contexte_id,
+            su_type_installation=type_installation or "",
+            su_delivery_date__gte=debut,
+            su_delivery_date__lt=fin,
+        ).aggregate(**_agregats_delai())
+
+        cle = {"dm_mois": mois, "dm_contexte_id": contexte_id, "dm_type": type_installation or ""}
+        if agg["ok"] + agg["ko"] == 0:
+            DelaiMensuel.objects.filter(**cle).delete()
+        else:
+            DelaiMensuel.objects.update_or_create(**cle, defaults={
+                "dm_ok": agg["ok"],
+                "dm_ko": agg["ko"],
+                "dm_tickets_ko": parse_tickets(agg["tickets_ko"]),
+            })
+
+
+def backfill_delais_mensuels(date_from=None, date_to=None, batch_size=1000):
+    """
+    Reconstruit le rollup (éventuellement sur une période) en une requête
+    GROUP BY puis bulk upsert par lots. Rejouable sans effet de bord.
+
+    :param date_from: (Optionnel) premier mois inclus
+    :param date_to: (Optionnel) mois exclu
+    """
+    queryset = _installs_delai()
+    rollup = DelaiMensuel.objects.all()
+    # Bornes arrondies au mois pour ne jamais réécrire un mois partiel
+    if date_from is not None:
+        queryset = queryset.filter(su_delivery_date__gte=_bornes_mois(_mois(date_from))[0])
+        rollup = rollup.filter(dm_mois__gte=_mois(date_from))
+    if date_to is not None:
+        queryset = queryset.filter(su_delivery_date__lt=_bornes_mois(_mois(date_to))[0])
+        rollup = rollup.filter(dm_mois__lt=_mois(date_to))
+
     stats = (
         queryset
-        .annotate(month=TruncMonth("su_delivery_date"))
-        .values("month")
-        .annotate(
-            ok=Count("id", filter=Q(su_delivery_date__lte=F("su_desired_delivery_date"))),
-            ko=Count("id", filter=Q(su_delivery_date__gt=F("su_desired_delivery_date"))),
-        )
-        .order_by("month")
+        .annotate(mois=TruncMonth("su_delivery_date"))
+        .values("mois", "su_contexte_id", "su_type_installation")
+        .annotate(**_agregats_delai())
+        .order_by()
     )
 
-    # Transformation en dictionnaire
-    results = {}
+    lignes = [
+        DelaiMensuel(
+            dm_mois=_mois(s["mois"]),
+            dm_contexte_id=s["su_contexte_id"],
+            dm_type=s["su_type_installation"] or "",
+            dm_ok=s["ok"],
+            dm_ko=s["ko"],
+            dm_tickets_ko=parse_tickets(s["tickets_ko"]),
+        )
+        for s in stats
+    ]
 
-    for s in stats:
-        month = s["month"]
-        month_key = month.strftime("%Y-%m")
-
-        # Récupération des tickets hors délai pour ce mois
-        hors_delais = list(
-            queryset.filter(
-                su_delivery_date__year=month.year,
-                su_delivery_date__month=month.month,
-                su_delivery_date__gt=F("su_desired_delivery_date")
-            ).values_list("su_mantis", flat=True)
+    with transaction.atomic():
+        rollup.delete()
+        DelaiMensuel.objects.bulk_create(
+            lignes,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["dm_mois", "dm_contexte", "dm_type"],
+            update_fields=["dm_ok", "dm_ko", "dm_tickets_ko"],
         )
+    return len(lignes)
 
-        results[month_key] = {
-            "ok": s["ok"],
-            "ko": s["ko"],
-            "tickets_ko": hors_delais
-        }
 
+def get_delais_mensuels(date_from=None, date_to=None, contexte_id=None, type_installation=None):
+    """
+    Même format que get_installations_stats(), lu depuis le rollup
+    (quelques lignes par mois au lieu de tout l'historique).
+    """
+    rollup = DelaiMensuel.objects.all()
+    if date_from is not None:
+        rollup = rollup.filter(dm_mois__gte=_mois(date_from))
+    if date_to is not None:
+        rollup = rollup.filter(dm_mois__lt=_mois(date_to))
+    if contexte_id is not None:
+        rollup = rollup.filter(dm_contexte_id=contexte_id)
+    if type_installation is not None:
+        rollup = rollup.filter(dm_type=type_installation)
+
+    results = {}
+    for mois, ok, ko, tickets in rollup.order_by("dm_mois").values_list("dm_mois", "dm_ok", "dm_ko", "dm_tickets_ko"):
+        month = results.setdefault(mois.strftime("%Y-%m"), {"ok": 0, "ko": 0, "tickets_ko": []})
+        month["ok"] += ok
+        month["ko"] += ko
+        month["tickets_ko"].extend(tickets)
+
+    for month in results.values():
+        month["tickets_ko"].sort()
     return results
 
 
+##### signals.py
+def _delai_seau(instance):
+    d = instance.__dict__
+    if d.get("su_delivery_date") is None:
+        return None
+    return (_mois(d["su_delivery_date"]), d.get("su_contexte_id"), d.get("su_type_installation") or "")
+
+
+def _delai_state(instance):
+    d = instance.__dict__
+    return (_delai_seau(instance), d.get("su_statut_id"), d.get("su_desired_delivery_date"))
+
+
+@receiver(post_init, sender=SuiviInstall)
+def delai_remember_state(sender, instance, **kwargs):
+    instance._delai_state = _delai_state(instance)
+
+
+@receiver(post_save, sender=SuiviInstall)
+def delai_on_install_saved(sender, instance, **kwargs):
+    old = getattr(instance, "_delai_state", None)
+    new = _delai_state(instance)
+    instance._delai_state = new
+    if old == new:
+        return
+
+    seaux = {s for s in (old[0] if old else None, new[0]) if s is not None and s[1] is not None}
+    if seaux:
+        transaction.on_commit(lambda: refresh_delais_mensuels(seaux))
+
+
+@receiver(post_delete, sender=SuiviInstall)
+def delai_on_install_deleted(sender, instance, **kwargs):
+    seau = _delai_seau(instance)
+    if seau is not None and seau[1] is not None:
+        transaction.on_commit(lambda: refresh_delais_mensuels([seau]))
+
+
+##### management/commands/backfill_delais_mensuels.py
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le rollup mensuel des délais de livraison"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", type=parse_date, default=None)
+        parser.add_argument("--to", dest="date_to", type=parse_date, default=None)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        nb = backfill_delais_mensuels(options["date_from"], options["date_to"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("%d ligne(s) de rollup écrite(s)" % nb))
+
+
 ###########
 from django.db.models import Prefetch
 
@@ -295,6 +765,34 @@ for inst in qs:
     })
 
 
+###########
+# Service de listing des installations (remplace le Prefetch ci-dessus)
+# - LOT@VERSION est construit en base (STRING_AGG / GROUP_CONCAT)
+# - contexte et statut sont joints (plus de requête cachée par ligne)
+# - les lignes sont produites par paquets : l'export XLSX et le flux
+#   Tabulator consomment le même service sans charger toute la table
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# lots_version_aggregate / installations_queryset / iter_installations_chunks : voir suivi.py
+from .suivi import iter_installations_chunks
+
+
+def installations_listing_json(request):
+    """Flux JSON (tableau) pour Tabulator, envoyé paquet par paquet."""
+    def stream():
+        yield "["
+        first = True
+        for chunk in iter_installations_chunks():
+            body = json.dumps(chunk, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":"))[1:-1]
+            yield body if first else "," + body
+            first = False
+        yield "]"
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
+
 
 
 from openpyxl import Workbook
@@ -478,6 +976,35 @@ def creer_fichier_mantis(filepath="donnees_mantis.xlsx"):
     print(f"Fichier créé : {filepath}")
 
 
+#############
+# Export XLSX en streaming : les lignes viennent directement du queryset
+# (iterator) et partent dans un classeur write_only, la mémoire reste
+# constante quel que soit le nombre d'installations.
+import tempfile
+
+from django.http import FileResponse
+
+# ecrire_export_mantis (colonnes, styles, écriture par paquets) : voir suivi.py
+from .suivi import ecrire_export_mantis
+
+
+def export_mantis_xlsx(request):
+    """
+    Vue : génère l'export dans un fichier temporaire (pas en mémoire)
+    et le renvoie en streaming par morceaux.
+    """
+    tmp = tempfile.TemporaryFile()
+    ecrire_export_mantis(tmp)
+    tmp.seek(0)
+    # FileResponse lit et ferme (donc supprime) le fichier temporaire
+    return FileResponse(
+        tmp,
+        as_attachment=True,
+        filename="donnees_mantis.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
 
 from django.db.models import Case, When, Value, IntegerField
 
@@ -492,6 +1019,147 @@ suivis = SuiviInstall.objects.annotate(
     )
 ).order_by("statut_order")
 
+#######
+# Tri par étape du workflow sans CASE sur le nom du statut
+# L'ordre est porté par le statut (s_sort_order) et recopié sur
+# l'installation (su_statut_order) pour qu'un index composite
+# (ordre statut, date de réception) serve directement le ORDER BY.
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+
+from .models import Statut, SuiviInstall
+from .suivi import STATUT_ORDER_DEFAULT, STATUT_SORT_ORDERS, invalidate_cartographie_cache, next_stamp
+
+
+##### models.py
+class SuiviInstallQuerySet(models.QuerySet):
+
+    def ordered_by_statut(self):
+        """Étape du workflow puis réception la plus récente (index suivi_statut_reception)."""
+        return self.order_by("su_statut_order", "-su_reception_date", "-id")
+
+
+# class Statut(models.Model):
+#     ...
+#     s_sort_order = models.PositiveSmallIntegerField(default=STATUT_ORDER_DEFAULT, db_index=True)
+#
+# class SuiviInstall(models.Model):
+#     ...
+#     su_statut_order = models.PositiveSmallIntegerField(default=STATUT_ORDER_DEFAULT)
+#
+#     objects = SuiviInstallQuerySet.as_manager()
+#
+#     class Meta:
+#         indexes = [
+#             models.Index(fields=["su_statut_order", "-su_reception_date", "-id"], name="suivi_statut_reception"),
+#         ]
+
+
+##### signals.py
+@receiver(pre_save, sender=SuiviInstall)
+def set_statut_order(sender, instance, **kwargs):
+    if instance.su_statut_id is None:
+        instance.su_statut_order = STATUT_ORDER_DEFAULT
+    elif SuiviInstall.su_statut.is_cached(instance):
+        instance.su_statut_order = instance.su_statut.s_sort_order
+    else:
+        order = Statut.objects.filter(pk=instance.su_statut_id).values_list("s_sort_order", flat=True).first()
+        # 0 est un ordre valide : seul un statut introuvable prend l'ordre par défaut
+        instance.su_statut_order = STATUT_ORDER_DEFAULT if order is None else order
+
+
+@receiver(post_save, sender=Statut)
+def statut_order_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    installs = SuiviInstall.objects.filter(su_statut=instance).exclude(su_statut_order=instance.s_sort_order)
+    if not installs.exists():
+        return
+    # update() ne passe pas par les signaux : estampille (flux delta) et
+    # version du cache de la grille posées ici, comme refresh_phase_dates
+    with transaction.atomic():
+        stamp = next_stamp()
+        installs.update(su_statut_order=instance.s_sort_order, su_stamp=stamp)
+    transaction.on_commit(invalidate_cartographie_cache)
+
+
+##### migrations/00XX_statut_order.py
+from django.db import migrations
+
+
+def backfill_statut_order(apps, schema_editor):
+    Statut = apps.get_model("Applications", "Statut")
+    SuiviInstall = apps.get_model("Applications", "SuiviInstall")
+    for statut in Statut.objects.all():
+        statut.s_sort_order = STATUT_SORT_ORDERS.get(statut.s_name, STATUT_ORDER_DEFAULT)
+        statut.save(update_fields=["s_sort_order"])
+        SuiviInstall.objects.filter(su_statut=statut).update(su_statut_order=statut.s_sort_order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Applications", "00XX_previous"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="statut",
+            name="s_sort_order",
+            field=models.PositiveSmallIntegerField(default=STATUT_ORDER_DEFAULT, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="suiviinstall",
+            name="su_statut_order",
+            field=models.PositiveSmallIntegerField(default=STATUT_ORDER_DEFAULT),
+        ),
+        migrations.RunPython(backfill_statut_order, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="suiviinstall",
+            index=models.Index(fields=["su_statut_order", "-su_reception_date", "-id"], name="suivi_statut_reception"),
+        ),
+    ]
+
+
+##### benchmark
+def bench_statut_order(nb_installs=100000, page_size=50, pages=(0, 100, 1000)):
+    """
+    Liste paginée triée par étape : CASE sur le nom vs index composite.
+    (base jetable : crée ``nb_installs`` installations)
+    """
+    statuts = [
+        Statut.objects.get_or_create(s_name=name, defaults={"s_sort_order": order})[0]
+        for name, order in STATUT_SORT_ORDERS.items()
+    ]
+    rnd = random.Random(14)
+    now = timezone.now()
+    SuiviInstall.objects.bulk_create([
+        SuiviInstall(
+            su_mantis=100000 + i,
+            su_statut=statut,
+            su_statut_order=statut.s_sort_order,
+            su_reception_date=now - timedelta(minutes=rnd.randint(0, 10 ** 6)),
+        )
+        for i, statut in enumerate(rnd.choice(statuts) for _ in range(nb_installs))
+    ], batch_size=5000)
+
+    ancien = SuiviInstall.objects.annotate(
+        statut_order=Case(
+            *[When(su_statut__s_name=name, then=Value(order)) for name, order in STATUT_SORT_ORDERS.items()],
+            default=Value(STATUT_ORDER_DEFAULT),
+            output_field=IntegerField(),
+        )
+    ).order_by("statut_order", "-su_reception_date", "-id")
+    nouveau = SuiviInstall.objects.ordered_by_statut()
+
+    for label, queryset in (("CASE sur s_name", ancien), ("index composite", nouveau)):
+        for page in pages:
+            start = time.perf_counter()
+            list(queryset.values_list("id", flat=True)[page * page_size:(page + 1) * page_size])
+            print("%-16s page %5d : %8.2f ms" % (label, page, (time.perf_counter() - start) * 1000))
+        print(queryset[:page_size].explain())
+
 import io
 
 import io
@@ -539,4 +1207,8 @@ def update_property(filepath, target_key, new_value):
     with io.open(filepath, 'w', encoding='utf-8') as f:
         f.writelines(lines)
 
-    print("Clé '%s' mise à jour avec la valeur '%s'." % (target_key, new_value))
\ No newline at end of file
+    print("Clé '%s' mise à jour avec la valeur '%s'." % (target_key, new_value))
+
+
+# Pour modifier plusieurs clés dans des centaines de .properties en une passe,
+# en parallèle, avec écriture atomique et rapport détaillé : voir properties.py
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation des requêtes SQL par vue (utilisable en production).
+
+- ``track_queries()`` : context manager qui compte les requêtes, le temps
+  passé en base et les requêtes répétées (même SQL, paramètres différents :
+  le signe d'un N+1), sans DEBUG (``connection.execute_wrapper``).
+- ``timed("serialize")`` : mesure un bloc de code Python (sérialisation JSON,
+  construction d'un classeur...) et l'ajoute à la mesure en cours, s'il y en a une.
+- ``QueryInstrumentationMiddleware`` : mesure un échantillon des requêtes HTTP
+  et renvoie le résultat en en-tête ``Server-Timing`` (visible dans l'onglet
+  Réseau du navigateur).
+- ``query_trace_api`` : endpoint JSON (staff, désactivé par défaut) avec les
+  dernières mesures et un cumul par vue.
+
+settings.py :
+    MIDDLEWARE = [..., "Applications.instrumentation.QueryInstrumentationMiddleware"]
+    QUERY_TRACE_SAMPLE_RATE = 0.05     # 5 % des requêtes (1.0 en dev)
+    QUERY_TRACE_ENDPOINT = True        # active /debug/queries/
+
+Une requête peut être forcée (staff uniquement) avec ``?_trace=1``.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Au-delà, une requête répétée dans la même vue est signalée comme N+1
+DUPLICATE_THRESHOLD = 10
+DUPLICATES_REPORTED = 5
+RECENT_TRACES = 200
+# Libellé des requêtes sans vue résolue (404...) : un seul compteur, pas un par chemin
+UNRESOLVED_LABEL = "<unresolved>"
+
+_current = ContextVar("query_trace", default=None)
+_IN_LIST_RE = re.compile(r"\((?:%s, )+%s\)")
+
+
+class QueryStats:
+    """Mesures d'un bloc de code (une vue, une fonction...)."""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = Counter()       # nom -> secondes (timed())
+        self.statements = Counter()  # SQL (sans les valeurs) -> nombre d'exécutions
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+            # "IN (%s, %s, %s)" et "IN (%s, %s)" sont la même requête
+            self.statements[_IN_LIST_RE.sub("(%s, ...)", sql)] += 1
+
+    def duplicates(self, limit=DUPLICATES_REPORTED):
+        """Requêtes exécutées plus d'une fois : [(sql, nombre), ...] les plus fréquentes d'abord."""
+        return [(sql, n) for sql, n in self.statements.most_common(limit) if n > 1]
+
+    def as_dict(self):
+        return OrderedDict([
+            ("label", self.label),
+            ("queries", self.queries),
+            ("db_ms", round(self.db_seconds * 1000, 2)),
+            ("spans_ms", {name: round(s * 1000, 2) for name, s in self.spans.items()}),
+            ("total_ms", round(self.seconds * 1000, 2)),
+            ("duplicates", [{"sql": sql, "count": n} for sql, n in self.duplicates()]),
+        ])
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing."""
+        dupes = sum(n - 1 for _sql, n in self.duplicates(limit=None))
+        # desc en ASCII : les en-têtes HTTP sont en latin-1
+        metrics = [
+            'db;dur=%.1f;desc="%d requetes, %d repetees"' % (self.db_seconds * 1000, self.queries, dupes),
+        ]
+        metrics += ["%s;dur=%.1f" % (name, s * 1000) for name, s in self.spans.items()]
+        app = self.seconds - self.db_seconds - sum(self.spans.values())
+        metrics.append("app;dur=%.1f" % (max(app, 0) * 1000))
+        return ", ".join(metrics)
+
+
+@contextmanager
+def track_queries(label=None, using=None):
+    """
+    Mesure les requêtes exécutées dans le bloc (toutes les bases par défaut).
+
+        with track_queries("stats") as stats:
+            get_installations_stats()
+        print(stats.queries, stats.db_seconds, stats.duplicates())
+    """
+    stats = QueryStats(label)
+    aliases = [using] if using else list(connections)
+    token = _current.set(stats)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            yield stats
+    finally:
+        stats.seconds = time.perf_counter() - start
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Ajoute la durée du bloc à la mesure en cours (ne fait rien hors mesure)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] += time.perf_counter() - start
+
+
+##### Historique (par process) pour l'endpoint de debug
+_recent = deque(maxlen=RECENT_TRACES)
+_per_view = {}
+_lock = threading.Lock()
+
+
+def _record(trace):
+    with _lock:
+        _recent.append(trace)
+        view = _per_view.setdefault(trace["label"], Counter())
+        view["requests"] += 1
+        view["queries"] += trace["queries"]
+        view["db_ms"] += trace["db_ms"]
+        view["total_ms"] += trace["total_ms"]
+        view["max_queries"] = max(view["max_queries"], trace["queries"])
+
+
+def get_query_traces():
+    """Dernières mesures et moyennes par vue."""
+    with _lock:
+        recent = list(_recent)
+        views = {label: dict(c) for label, c in _per_view.items()}
+    for c in views.values():
+        for key in ("queries", "db_ms", "total_ms"):
+            c["avg_" + key] = round(c.pop(key) / c["requests"], 2)
+    return {"sample_rate": _sample_rate(), "recent": recent[::-1], "views": views}
+
+
+def _sample_rate():
+    return getattr(settings, "QUERY_TRACE_SAMPLE_RATE", 1.0 if settings.DEBUG else 0.0)
+
+
+##### Middleware
+class QueryInstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _should_trace(self, request):
+        if request.GET.get("_trace") == "1":
+            user = getattr(request, "user", None)
+            return bool(user and user.is_staff)
+        rate = _sample_rate()
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self._should_trace(request):
+            return self.get_response(request)
+
+        with track_queries() as stats:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        stats.label = match.view_name if match else UNRESOLVED_LABEL
+        # Réponse en streaming : seules les requêtes faites avant le premier octet sont comptées
+        response["Server-Timing"] = stats.server_timing()
+
+        trace = stats.as_dict()
+        trace.update(path=request.path, method=request.method, status=response.status_code, at=time.time())
+        _record(trace)
+
+        worst = stats.duplicates(limit=1)
+        if worst and worst[0][1] >= DUPLICATE_THRESHOLD:
+            logger.warning("N+1 probable sur %s : %d x %s", stats.label, worst[0][1], worst[0][0][:200])
+        return response
+
+
+##### Endpoint de debug
+def query_trace_api(request):
+    """Mesures récentes (JSON), réservé au staff et désactivé par défaut."""
+    if not getattr(settings, "QUERY_TRACE_ENDPOINT", False):
+        raise Http404
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(get_query_traces())
+
+# urls.py :
+# path("debug/queries/", query_trace_api, name="debug_queries"),
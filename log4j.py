@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+Modification en masse des niveaux de log dans les fichiers log4j2.xml.
+
+Version "batch" de ``modify_log4j_levels`` (voir example.py) :
+- on accepte un dossier ou un glob,
+- la détection se fait en streaming (``iterparse``) et la réécriture
+  chunk par chunk, donc la mémoire reste plate même sur de gros fichiers,
+- on cible les loggers par nom (motif), par balise (Logger, AsyncLogger,
+  Root, AsyncRoot) ou par niveau actuel,
+- on calcule d'abord le diff (change set) : les fichiers sans changement
+  ne sont pas touchés (pas de rechargement ``monitorInterval`` inutile),
+- l'écriture est atomique (fichier temporaire + ``os.replace``).
+
+Exemple :
+    python log4j.py /opt/apps WARN
+    python log4j.py "/opt/apps/**/log4j2.xml" DEBUG --workers 8
+    python log4j.py /opt/apps INFO --name "com.acme.*" --from-level DEBUG --dry-run
+"""
+import argparse
+import fnmatch
+import glob
+import os
+import re
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PATTERN = "log4j2*.xml"
+
+# Balises portant un niveau de log dans log4j2
+LOGGER_TAGS = ("Logger", "AsyncLogger", "Root", "AsyncRoot")
+DEFAULT_TAGS = ("Logger",)
+
+# Commentaires / CDATA (à recopier tels quels) ou balise logger
+_TOKEN_RE = re.compile(
+    rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(?:Logger|AsyncLogger|Root|AsyncRoot)\b[^>]*>",
+    re.S,
+)
+_LEVEL_RE = re.compile(rb"""(\slevel\s*=\s*)(["'])(.*?)\2""", re.S)
+
+# Un changement = un élément logger d'un fichier.
+# ``index`` est le rang de l'élément parmi tous les LOGGER_TAGS du fichier
+# (ordre du document), c'est ce qui permet de le retrouver à la réécriture.
+LevelChange = namedtuple("LevelChange", "path index tag name old new")
+
+
+def _local_name(tag):
+    """Retire l'éventuel namespace '{...}' d'un tag ElementTree."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _same_level(a, b):
+    """Les niveaux log4j2 ne sont pas sensibles à la casse."""
+    return a is not None and b is not None and a.upper() == b.upper()
+
+
+def _matches(tag, name, level, names, tags, levels):
+    if tag not in tags:
+        return False
+    if names is not None and not any(fnmatch.fnmatchcase(name or "", p) for p in names):
+        return False
+    if levels is not None and (level or "").upper() not in levels:
+        return False
+    return True
+
+
+def diff_log4j_levels(xml_path, new_level, names=None, tags=DEFAULT_TAGS, levels=None):
+    """
+    Calcule (sans rien écrire) les loggers dont le niveau doit changer.
+
+    :param xml_path: Chemin du fichier XML
+    :param new_level: Niveau cible (ex: 'WARN')
+    :param names: Motifs fnmatch sur l'attribut name (ex: ['com.acme.*']), None = tous
+    :param tags: Balises ciblées parmi LOGGER_TAGS
+    :param levels: Niveaux actuels ciblés (ex: ['DEBUG', 'TRACE']), None = tous
+    :return: liste de LevelChange (vide si le fichier est déjà à jour)
+    """
+    if levels is not None:
+        levels = {lvl.upper() for lvl in levels}
+
+    changes = []
+    index = 0
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event == "start":
+            tag = _local_name(elem.tag)
+            if tag in LOGGER_TAGS:
+                name = elem.get("name")
+                level = elem.get("level")
+                if (_matches(tag, name, level, names, tags, levels)
+                        and not _same_level(level, new_level)):
+                    changes.append(LevelChange(xml_path, index, tag, name, level, new_level))
+                index += 1
+        else:
+            # Mémoire plate : on ne garde pas l'arbre
+            elem.clear()
+            if elem is not root:
+                root.clear()
+    return changes
+
+
+def _get_level(tag):
+    match = _LEVEL_RE.search(tag)
+    return match.group(3).decode("ascii", "replace") if match else None
+
+
+def _set_level(tag, new_level):
+    """Remplace (ou ajoute) l'attribut level d'une balise logger."""
+    level = new_level.encode("ascii")
+    match = _LEVEL_RE.search(tag)
+    if match:
+        return tag[:match.start(3)] + level + tag[match.end(3):]
+    # Pas d'attribut level : on l'ajoute avant '>' ou '/>'
+    end = len(tag) - 2 if tag.endswith(b"/>") else len(tag) - 1
+    return tag[:end].rstrip() + b' level="' + level + b'"' + tag[end:]
+
+
+def _scan_limit(buf):
+    """
+    Position jusqu'à laquelle le buffer peut être traité sans couper
+    une balise, un commentaire ou une section CDATA en deux.
+    """
+    limit = len(buf)
+    for opener, closer in ((b"<!--", b"-->"), (b"<![CDATA[", b"]]>")):
+        i = buf.rfind(opener)
+        if i != -1 and buf.find(closer, i + len(opener)) == -1:
+            limit = min(limit, i)
+    i = buf.rfind(b"<")
+    if i != -1 and buf.find(b">", i) == -1:
+        limit = min(limit, i)
+    return limit
+
+
+def _rewrite_stream(src, dst, changes, chunk_size=CHUNK_SIZE):
+    """
+    Recopie ``src`` dans ``dst`` en appliquant ``changes`` (LevelChange).
+    Le reste du fichier (commentaires, indentation, encodage) est conservé
+    à l'octet près. Retourne le nombre de loggers modifiés.
+    """
+    by_index = {c.index: c for c in changes}
+    index = 0
+    changed = 0
+    buf = b""
+    eof = False
+    while not eof:
+        chunk = src.read(chunk_size)
+        eof = not chunk
+        buf += chunk
+        limit = len(buf) if eof else _scan_limit(buf)
+
+        pos = 0
+        for match in _TOKEN_RE.finditer(buf, 0, limit):
+            token = match.group(0)
+            if token.startswith(b"<!"):
+                continue
+            change = by_index.get(index)
+            index += 1
+            if change is None:
+                continue
+            if _get_level(token) != change.old:
+                raise ValueError(
+                    "%s : le logger #%d a changé depuis le diff (%r au lieu de %r)"
+                    % (change.path, change.index, _get_level(token), change.old)
+                )
+            dst.write(buf[pos:match.start()])
+            dst.write(_set_level(token, change.new))
+            pos = match.end()
+            changed += 1
+        dst.write(buf[pos:limit])
+        buf = buf[limit:]
+    return changed
+
+
+def apply_log4j_changes(xml_path, changes):
+    """
+    Applique une liste de LevelChange à un fichier, de façon atomique.
+    Si la liste est vide, le fichier n'est pas ouvert en écriture.
+
+    :return: nombre de loggers modifiés
+    """
+    if not changes:
+        return 0
+
+    directory = os.path.dirname(os.path.abspath(xml_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".log4j2-", suffix=".tmp")
+    try:
+        with open(xml_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            changed = _rewrite_stream(src, dst, changes)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(xml_path, tmp_path)
+        os.replace(tmp_path, xml_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return changed
+
+
+def _timed(func, path, *args):
+    """Exécute ``func(path, *args)`` et renvoie un résultat homogène pour le batch."""
+    start = time.perf_counter()
+    result = {"path": path, "value": None, "error": None}
+    try:
+        result["value"] = func(path, *args)
+    # UnicodeError : niveau impossible à écrire dans le fichier (ex: 'AVERTISSEMENT_É'),
+    # noté pour ce fichier comme les autres erreurs, le batch continue
+    except (OSError, ValueError, UnicodeError, ET.ParseError) as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _diff_job(args):
+    return _timed(diff_log4j_levels, *args)
+
+
+def _apply_job(args):
+    return _timed(apply_log4j_changes, *args)
+
+
+def iter_log4j_files(target, pattern=DEFAULT_PATTERN):
+    """
+    Liste les fichiers à traiter.
+
+    :param target: Dossier (parcouru récursivement) ou glob (``**`` accepté)
+    :param pattern: Motif des noms de fichiers quand ``target`` est un dossier
+    """
+    if os.path.isdir(target):
+        for dirpath, _dirnames, filenames in os.walk(target):
+            for filename in fnmatch.filter(filenames, pattern):
+                yield os.path.join(dirpath, filename)
+    else:
+        for path in glob.iglob(target, recursive=True):
+            if os.path.isfile(path):
+                yield path
+
+
+def _scan(target, new_level, names, tags, levels, workers, pattern):
+    """Diff de chaque fichier : liste de dict {path, value (LevelChange), error, seconds}."""
+    paths = sorted(iter_log4j_files(target, pattern))
+    jobs = [(path, new_level, names, tags, levels) for path in paths]
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_diff_job, jobs, chunksize=16))
+
+
+def _build_changeset(results):
+    changeset = OrderedDict()
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["path"]] = r["error"]
+        elif r["value"]:
+            changeset[r["path"]] = r["value"]
+    return changeset, errors
+
+
+def plan_log4j_levels(target, new_level, names=None, tags=DEFAULT_TAGS, levels=None,
+                      workers=None, pattern=DEFAULT_PATTERN):
+    """
+    Calcule le change set pour tout un dossier / glob, en parallèle.
+
+    :return: (change set, erreurs) où le change set est un
+             OrderedDict {chemin: [LevelChange, ...]} limité aux fichiers à modifier
+             et erreurs un dict {chemin: message}
+    """
+    return _build_changeset(_scan(target, new_level, names, tags, levels, workers, pattern))
+
+
+def apply_changeset(changeset, workers=None):
+    """
+    Applique un change set (voir ``plan_log4j_levels``) en parallèle.
+    Un change set peut être construit à la main ou fusionné depuis plusieurs
+    plans avant d'être appliqué en une seule passe.
+
+    :return: liste de dict {path, value (loggers modifiés), error, seconds}
+    """
+    jobs = list(changeset.items())
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_apply_job, jobs, chunksize=16))
+
+
+def batch_modify_log4j_levels(target, new_level, names=None, tags=DEFAULT_TAGS, levels=None,
+                              workers=None, pattern=DEFAULT_PATTERN, dry_run=False, verbose=True):
+    """
+    Applique ``new_level`` aux loggers ciblés de tous les log4j2.xml
+    d'un dossier ou d'un glob. Seuls les fichiers qui changent sont réécrits.
+
+    :param target: Dossier ou glob
+    :param new_level: Nouveau niveau de log
+    :param names: Motifs sur le nom des loggers (None = tous)
+    :param tags: Balises ciblées (défaut : Logger seulement, comme modify_log4j_levels)
+    :param levels: Niveaux actuels ciblés (None = tous)
+    :param workers: Nombre de processus (défaut : nombre de CPU)
+    :param pattern: Motif des fichiers quand ``target`` est un dossier
+    :param dry_run: Calcule et affiche le diff sans rien écrire
+    :param verbose: Affiche le temps par fichier et le résumé
+    :return: (change set, résultats par fichier parcouru, résumé) ; chaque
+             résultat vaut {path, planned, loggers, error, seconds} où
+             seconds = diff + réécriture
+    """
+    start = time.perf_counter()
+    scans = _scan(target, new_level, names, tags, levels, workers, pattern)
+    changeset, _errors = _build_changeset(scans)
+    applied = {} if dry_run else {r["path"]: r for r in apply_changeset(changeset, workers)}
+
+    results = []
+    for scan in scans:
+        result = {
+            "path": scan["path"],
+            "planned": len(scan["value"] or ()),
+            "loggers": 0,
+            "error": scan["error"],
+            "seconds": scan["seconds"],
+        }
+        apply = applied.get(scan["path"])
+        if apply is not None:
+            result["loggers"] = apply["value"] or 0
+            result["error"] = apply["error"]
+            result["seconds"] += apply["seconds"]
+        results.append(result)
+
+    summary = {
+        "files": len(results),
+        "planned": len(changeset),
+        "changed": sum(1 for r in results if r["loggers"] and not r["error"]),
+        "unchanged": sum(1 for r in results if not r["planned"] and not r["error"]),
+        "errors": sum(1 for r in results if r["error"]),
+        "loggers": sum(r["loggers"] for r in results),
+        "seconds": time.perf_counter() - start,
+    }
+
+    if verbose:
+        for path, changes in changeset.items():
+            for c in changes:
+                print("%s  <%s name=%r> %s -> %s" % (path, c.tag, c.name, c.old, c.new))
+        for r in results:
+            if r["error"]:
+                state = "ERREUR (%s)" % r["error"]
+            elif r["loggers"]:
+                state = "modifié (%d logger(s))" % r["loggers"]
+            elif r["planned"]:
+                state = "à modifier (%d logger(s))" % r["planned"]
+            else:
+                state = "inchangé"
+            print("%8.1f ms  %s  %s" % (r["seconds"] * 1000, r["path"], state))
+        print(
+            "✅ %(files)d fichier(s) : %(planned)d à modifier, %(changed)d modifié(s), "
+            "%(unchanged)d inchangé(s), %(errors)d erreur(s), %(loggers)d logger(s) "
+            "en %(seconds).2f s" % summary
+        )
+
+    return changeset, results, summary
+
+
+# --- Exemple d'utilisation ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Change le niveau des loggers dans des log4j2.xml")
+    parser.add_argument("target", help="Dossier ou glob (ex: '/opt/apps/**/log4j2.xml')")
+    parser.add_argument("level", help="Nouveau niveau (ex: WARN)")
+    parser.add_argument("--name", action="append", dest="names", help="Motif sur le nom du logger (répétable)")
+    parser.add_argument("--tag", action="append", dest="tags", choices=LOGGER_TAGS,
+                        help="Balise ciblée (répétable, défaut : Logger)")
+    parser.add_argument("--from-level", action="append", dest="levels",
+                        help="Ne modifier que les loggers à ce niveau (répétable)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    _changeset, _results, _summary = batch_modify_log4j_levels(
+        args.target, args.level,
+        names=args.names,
+        tags=tuple(args.tags or DEFAULT_TAGS),
+        levels=args.levels,
+        workers=args.workers,
+        pattern=args.pattern,
+        dry_run=args.dry_run,
+    )
+    raise SystemExit(1 if _summary["errors"] else 0)
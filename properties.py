@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Modification en masse de fichiers .properties.
+
+Version "batch" de ``update_property`` (voir example.py) :
+- plusieurs clés modifiées en une seule lecture / écriture par fichier,
+- plusieurs fichiers traités en parallèle (dossier ou glob),
+- le fichier n'est réécrit que si au moins une clé change,
+- l'écriture est atomique (fichier temporaire + ``os.replace``) :
+  un crash en cours d'écriture ne laisse jamais de fichier tronqué,
+- on renvoie un rapport par fichier (clés modifiées, déjà à la bonne
+  valeur, absentes) au lieu de faire des print.
+
+Exemple :
+    python properties.py /opt/apps db.pool.size=20 db.timeout=30
+    python properties.py "/opt/apps/**/app*.properties" log.level=WARN --workers 16 --dry-run
+"""
+import argparse
+import fnmatch
+import glob
+import io
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PATTERN = "*.properties"
+ENCODING = "utf-8"
+
+# Rapport d'un fichier :
+# - changed   : OrderedDict {clé: (ancienne valeur, nouvelle valeur)}
+# - unchanged : clés déjà à la bonne valeur
+# - missing   : clés demandées mais absentes du fichier
+# - error     : message si le fichier n'a pas pu être traité, sinon None
+PropertiesReport = namedtuple("PropertiesReport", "path changed unchanged missing error seconds")
+
+
+def _split_line(line):
+    """
+    Découpe une ligne ``clé=valeur`` (même règle que ``update_property``).
+
+    :return: (clé, valeur) ou None pour un commentaire / une ligne vide / sans '='
+    """
+    stripped = line.strip()
+    if not stripped or stripped.startswith(("#", "!")) or "=" not in line:
+        return None
+    key, value = line.split("=", 1)
+    return key.strip(), value.strip()
+
+
+def _line_ending(line):
+    if line.endswith("\r\n"):
+        return "\r\n"
+    if line.endswith("\n"):
+        return "\n"
+    return ""
+
+
+def rewrite_properties(lines, updates):
+    """
+    Applique ``updates`` à une liste de lignes, en une passe.
+    Les lignes non concernées (commentaires, indentation, fins de ligne)
+    sont conservées telles quelles. Une clé présente plusieurs fois est
+    modifiée à chaque occurrence, comme dans ``update_property``.
+
+    :return: (nouvelles lignes, changed, unchanged, missing)
+    """
+    changed = OrderedDict()
+    seen = set()
+    out = []
+    for line in lines:
+        parsed = _split_line(line)
+        if parsed is None or parsed[0] not in updates:
+            out.append(line)
+            continue
+        key, value = parsed
+        seen.add(key)
+        new_value = updates[key]
+        if value == new_value:
+            out.append(line)
+            continue
+        changed[key] = (value, new_value)
+        out.append(u"%s=%s%s" % (key, new_value, _line_ending(line) or "\n"))
+
+    unchanged = [k for k in updates if k in seen and k not in changed]
+    missing = [k for k in updates if k not in seen]
+    return out, changed, unchanged, missing
+
+
+def _write_atomic(filepath, lines):
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".properties-", suffix=".tmp")
+    try:
+        with io.open(fd, "w", encoding=ENCODING, newline="") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def update_properties(filepath, updates, dry_run=False):
+    """
+    Modifie plusieurs clés d'un fichier .properties (une lecture, au plus une écriture).
+
+    :param filepath: Chemin du fichier
+    :param updates: dict {clé: nouvelle valeur}
+    :param dry_run: Calcule le rapport sans rien écrire
+    :return: PropertiesReport
+    """
+    start = time.perf_counter()
+    try:
+        # newline="" : on garde les \r\n d'origine
+        with io.open(filepath, "r", encoding=ENCODING, newline="") as f:
+            lines, changed, unchanged, missing = rewrite_properties(f, updates)
+        if changed and not dry_run:
+            _write_atomic(filepath, lines)
+    except (OSError, UnicodeError) as e:
+        return PropertiesReport(filepath, OrderedDict(), [], [], str(e), time.perf_counter() - start)
+    return PropertiesReport(filepath, changed, unchanged, missing, None, time.perf_counter() - start)
+
+
+def iter_properties_files(target, pattern=DEFAULT_PATTERN):
+    """
+    Liste les fichiers à traiter.
+
+    :param target: Dossier (parcouru récursivement), glob (``**`` accepté) ou fichier
+    :param pattern: Motif des noms de fichiers quand ``target`` est un dossier
+    """
+    if os.path.isdir(target):
+        for dirpath, _dirnames, filenames in os.walk(target):
+            for filename in fnmatch.filter(filenames, pattern):
+                yield os.path.join(dirpath, filename)
+    else:
+        for path in glob.iglob(target, recursive=True):
+            if os.path.isfile(path):
+                yield path
+
+
+def apply_properties_plan(plan, workers=None, dry_run=False):
+    """
+    Applique un plan {chemin: {clé: valeur}} en parallèle (un thread par fichier,
+    le travail est surtout des E/S). Permet des valeurs différentes par fichier.
+
+    :return: liste de PropertiesReport, dans l'ordre du plan
+    """
+    if not plan:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda item: update_properties(item[0], item[1], dry_run), plan.items()))
+
+
+def batch_update_properties(target, updates, workers=None, pattern=DEFAULT_PATTERN,
+                            dry_run=False, verbose=True):
+    """
+    Applique les mêmes ``updates`` à tous les .properties d'un dossier ou d'un glob.
+
+    :param target: Dossier, glob ou fichier
+    :param updates: dict {clé: nouvelle valeur}
+    :param workers: Nombre de threads (défaut : celui de ThreadPoolExecutor)
+    :param pattern: Motif des fichiers quand ``target`` est un dossier
+    :param dry_run: Calcule et affiche le rapport sans rien écrire
+    :param verbose: Affiche le détail par fichier et le résumé
+    :return: (liste de PropertiesReport, résumé)
+    """
+    start = time.perf_counter()
+    plan = OrderedDict((path, updates) for path in sorted(iter_properties_files(target, pattern)))
+    reports = apply_properties_plan(plan, workers, dry_run)
+
+    summary = {
+        "files": len(reports),
+        "changed": sum(1 for r in reports if r.changed),
+        "keys": sum(len(r.changed) for r in reports),
+        "missing": sum(1 for r in reports if r.missing),
+        "errors": sum(1 for r in reports if r.error),
+        "seconds": time.perf_counter() - start,
+    }
+
+    if verbose:
+        for r in reports:
+            if r.error:
+                print("ERREUR  %s  %s" % (r.path, r.error))
+                continue
+            for key, (old, new) in r.changed.items():
+                print("%s  %s : %r -> %r" % (r.path, key, old, new))
+            if r.unchanged:
+                print("%s  déjà à jour : %s" % (r.path, ", ".join(r.unchanged)))
+            if r.missing:
+                print("%s  clé(s) absente(s) : %s" % (r.path, ", ".join(r.missing)))
+        print(
+            "✅ %(files)d fichier(s), %(changed)d modifié(s) (%(keys)d clé(s)), "
+            "%(missing)d avec clé(s) absente(s), %(errors)d erreur(s) en %(seconds).2f s" % summary
+        )
+
+    return reports, summary
+
+
+def _key_value(arg):
+    if "=" not in arg:
+        raise argparse.ArgumentTypeError("attendu clé=valeur : %r" % arg)
+    key, value = arg.split("=", 1)
+    return key.strip(), value.strip()
+
+
+# --- Exemple d'utilisation ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modifie des clés dans des fichiers .properties")
+    parser.add_argument("target", help="Dossier, glob (ex: '/opt/apps/**/*.properties') ou fichier")
+    parser.add_argument("updates", nargs="+", type=_key_value, help="clé=valeur (répétable)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    _reports, _summary = batch_update_properties(
+        args.target, OrderedDict(args.updates),
+        workers=args.workers,
+        pattern=args.pattern,
+        dry_run=args.dry_run,
+    )
+    raise SystemExit(1 if _summary["errors"] else 0)
@@ -4,7 +4,8 @@ from django.db.models import (
 import json
 
 
-def get_installations_with_lots_json():
+def get_installations_with_lots_json_legacy():
+    """Ancienne version (5 sous-requêtes corrélées par ligne), gardée pour comparaison."""
 
     # Sous-requête = version de lot correspondant au Mantis du ticket
     lot_version_qs = SuiviLotVersion.objects.filter(
@@ -132,6 +133,973 @@ def get_installations_with_lots_json():
 
     return json.dumps(list(installations.values()), default=str, indent=2)
 
+
+########
+# Version sans sous-requêtes corrélées
+# La dernière SuiviLotVersion de chaque (lot, mantis) est lue une seule fois
+# (DISTINCT ON sous PostgreSQL, MAX(id) groupé ailleurs) puis rattachée
+# en mémoire aux lignes (installation, lot).
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# latest_lot_versions / get_installations_with_lots(_json) : voir suivi.py
+from .suivi import get_installations_with_lots_json, latest_lot_versions
+
+
+# --- Mesure avant / après ---
+def seed_lot_versions(versions_par_lot=3):
+    """
+    Ajoute des SuiviLotVersion pour chaque (installation, lot) existant
+    (à lancer après seed_cartographie_dataset() sur une base jetable).
+    """
+    Through = SuiviInstall.su_lots.through
+    rows = Through.objects.values_list('lot_id', 'suiviinstall__su_mantis').iterator(chunk_size=5000)
+    batch = []
+    for i, (lot_id, mantis) in enumerate(rows):
+        for v in range(versions_par_lot):
+            batch.append(SuiviLotVersion(
+                si_lot_id=lot_id,
+                si_installation_mantis=mantis,
+                si_is_new_lot=(i + v) % 5 == 0,
+                si_updated_artefact_number=v,
+            ))
+        if len(batch) >= 5000:
+            SuiviLotVersion.objects.bulk_create(batch)
+            batch = []
+    SuiviLotVersion.objects.bulk_create(batch)
+
+
+def bench_installations_with_lots():
+    """Nombre de requêtes et temps : sous-requêtes corrélées vs prefetch unique."""
+    results = {}
+    for func in (get_installations_with_lots_json_legacy, get_installations_with_lots_json):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            results[func.__name__] = func()
+            duration = time.perf_counter() - start
+        print("%-40s %8.1f ms  %4d requête(s)" % (func.__name__, duration * 1000, len(ctx.captured_queries)))
+
+    old = json.loads(results['get_installations_with_lots_json_legacy'])
+    new = json.loads(results['get_installations_with_lots_json'])
+    print("Résultats identiques :", old == new)
+
+
+########
+# API paginée (keyset) pour le tableau Tabulator en mode "remote"
+# GET /api/installations/?size=100&cursor=...&sort[0][field]=su_mantis&sort[0][dir]=asc
+#                        &filter[0][field]=su_statut&filter[0][type]==&filter[0][value]=Terminé
+# Réponse : {"last_page": n, "next_cursor": "...", "data": [...]}
+# La pagination se fait par curseur (dernière valeur triée + id) et non
+# par OFFSET : la page 500 coûte autant que la page 1.
+import base64
+import re
+from collections import OrderedDict
+
+from django.db.models import F, Q
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+
+try:
+    import orjson  # encodeur rapide si disponible
+except ImportError:
+    orjson = None
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# champ Tabulator -> champ ORM (tri possible)
+API_SORT_FIELDS = {
+    'su_reception_date': 'su_reception_date',
+    'id': 'id',
+    'su_mantis': 'su_mantis',
+    'su_priorite': 'su_priorite',
+    'su_type_installation': 'su_type_installation',
+    'su_contexte': 'su_contexte__c_name',
+    'su_statut': 'su_statut__s_name',
+}
+
+# champ Tabulator -> champ ORM (filtre possible)
+API_FILTER_FIELDS = {
+    'su_description': 'su_description',
+    'su_type_installation': 'su_type_installation',
+    'su_contexte': 'su_contexte__c_name',
+    'su_statut': 'su_statut__s_name',
+    'su_mantis': 'su_mantis',
+}
+API_FILTER_LOOKUPS = {'like': 'icontains', '=': 'exact', 'starts': 'istartswith'}
+
+# colonnes renvoyées au tableau (clé JSON -> champ ORM)
+API_FIELDS = OrderedDict([
+    ('id', 'id'),
+    ('su_mantis', 'su_mantis'),
+    ('su_priorite', 'su_priorite'),
+    ('su_description', 'su_description'),
+    ('su_type_installation', 'su_type_installation'),
+    ('su_contexte', 'su_contexte__c_name'),
+    ('su_statut', 'su_statut__s_name'),
+    ('su_commentary', 'su_commentary'),
+    ('su_reception_date', 'su_reception_date'),
+    ('su_nb_known_lot', 'su_nb_known_lot'),
+    ('su_nb_new_version', 'su_nb_new_version'),
+    ('su_nb_new_lot', 'su_nb_new_lot'),
+])
+
+_PARAM_RE = re.compile(r'^(sort|filter)\[(\d+)\]\[(\w+)\]$')
+
+
+def _json_default(value):
+    # Dates au format ISO, comme orjson
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _tabulator_params(querydict):
+    """sort[0][field]=... -> {'sort': [{'field': ...}], 'filter': [...]}"""
+    params = {'sort': {}, 'filter': {}}
+    for key, value in querydict.items():
+        match = _PARAM_RE.match(key)
+        if match:
+            kind, idx, attr = match.groups()
+            params[kind].setdefault(int(idx), {})[attr] = value
+    return {kind: [v for _i, v in sorted(items.items())] for kind, items in params.items()}
+
+
+def _encode_cursor(sort_field, direction, value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([sort_field, direction, value, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    sort_field, direction, value, pk = json.loads(raw)
+    if sort_field == 'su_reception_date' and value is not None:
+        value = parse_datetime(value)
+    return sort_field, direction, value, pk
+
+
+def _after_cursor(field, direction, value, pk):
+    """
+    Lignes situées après (value, pk) pour un tri
+    'field <dir> NULLS LAST, id <dir>'.
+    """
+    sup = 'lt' if direction == 'desc' else 'gt'
+    if value is None:
+        return Q(**{field + '__isnull': True, 'id__' + sup: pk})
+    return (
+        Q(**{field + '__' + sup: value})
+        | Q(**{field: value, 'id__' + sup: pk})
+        | Q(**{field + '__isnull': True})
+    )
+
+
+def installations_page(params, cursor=None, size=API_PAGE_SIZE):
+    """
+    Une page d'installations (keyset), filtrée et triée comme Tabulator.
+
+    :return: (lignes, curseur suivant ou None)
+    """
+    size = max(1, size)
+    queryset = SuiviInstall.objects.all()
+
+    for f in params['filter']:
+        field = API_FILTER_FIELDS.get(f.get('field'))
+        lookup = API_FILTER_LOOKUPS.get(f.get('type', 'like'))
+        if field and lookup and f.get('value', '') != '':
+            queryset = queryset.filter(**{'%s__%s' % (field, lookup): f['value']})
+
+    # Un seul critère de tri (le premier), id en départage
+    sort = params['sort'][0] if params['sort'] else {}
+    sort_key = sort.get('field') if sort.get('field') in API_SORT_FIELDS else 'su_reception_date'
+    direction = 'asc' if sort.get('dir') == 'asc' else 'desc'
+    field = API_SORT_FIELDS[sort_key]
+
+    if cursor:
+        cursor_key, cursor_dir, value, pk = _decode_cursor(cursor)
+        if (cursor_key, cursor_dir) != (sort_key, direction):
+            raise ValueError("curseur incompatible avec le tri demandé")
+        queryset = queryset.filter(_after_cursor(field, direction, value, pk))
+
+    order = F(field).desc(nulls_last=True) if direction == 'desc' else F(field).asc(nulls_last=True)
+    rows = list(
+        queryset
+        .order_by(order, '-id' if direction == 'desc' else 'id')
+        .values_list(*API_FIELDS.values(), field)[:size + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_key, direction, last[-1], last[0])
+
+    keys = list(API_FIELDS)
+    data = [dict(zip(keys, r[:-1])) for r in rows]
+    _attach_lots(data)
+    return data, next_cursor
+
+
+def _attach_lots(data):
+    """Ajoute su_lots = {nom: {version, is_new_version, is_new_lot}} (2 requêtes par page)."""
+    ids = [d['id'] for d in data]
+    if not ids:
+        return
+    page = SuiviInstall.objects.filter(id__in=ids)
+    versions = latest_lot_versions(page)
+    by_id = {d['id']: d for d in data}
+    for d in data:
+        d['su_lots'] = {}
+
+    for inst_id, mantis, lot_id, lot_name, lot_version in page.filter(su_lots__isnull=False).values_list(
+        'id', 'su_mantis', 'su_lots__id', 'su_lots__l_name', 'su_lots__l_version'
+    ):
+        is_new_lot = versions.get((lot_id, mantis), (None, None))[1]
+        by_id[inst_id]['su_lots'][lot_name] = {
+            'version': lot_version,
+            'is_new_lot': bool(is_new_lot),
+            'is_new_version': is_new_lot is False,
+        }
+
+
+def installations_api(request):
+    """Endpoint JSON paginé, réponse envoyée en flux ligne par ligne."""
+    try:
+        size = int(request.GET.get('size', API_PAGE_SIZE))
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseBadRequest("size et page doivent être des entiers")
+    size = max(1, min(size, API_MAX_PAGE_SIZE))
+    # Pagination par curseur : sans lui, une page > 1 renverrait la page 1
+    # (lignes en double côté Tabulator)
+    if page > 1 and not request.GET.get('cursor'):
+        return HttpResponseBadRequest("page > 1 sans cursor : repartir du next_cursor de la page précédente")
+
+    try:
+        data, next_cursor = installations_page(
+            _tabulator_params(request.GET),
+            cursor=request.GET.get('cursor'),
+            size=size,
+        )
+    except (ValueError, TypeError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    def stream():
+        meta = {'last_page': page + 1 if next_cursor else page, 'next_cursor': next_cursor}
+        yield _dumps(meta)[:-1] + b',"data":['
+        for i, row in enumerate(data):
+            yield (b',' if i else b'') + _dumps(row)
+        yield b']}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+# urls.py :
+# path("api/installations/", installations_api, name="api_installations"),
+
+
+########
+# Flux delta : seules les lignes modifiées depuis un curseur
+# GET /api/changes/?since=1234
+# Réponse : {"cursor": 1240, "reset": false,
+#            "suiviinstall": {"upserts": [...], "deletes": [ids]},
+#            "cartographie": {"upserts": [...], "deletes": [ids]}}
+#
+# Chaque sauvegarde de SuiviInstall / Cartographie reçoit une estampille
+# prise dans un compteur unique en base. Le compteur est incrémenté par
+# UPDATE dans la même transaction que l'écriture de l'estampille : la ligne
+# du compteur reste verrouillée jusqu'au commit, donc les estampilles
+# deviennent visibles dans l'ordre (pas de "trou" qui ferait rater une
+# modification à un client). Les suppressions laissent une pierre tombale,
+# purgée au bout de DELTA_TOMBSTONE_DAYS jours.
+from datetime import date, datetime, timedelta
+
+from django.db import models, transaction
+from django.db.models import Max
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils import timezone
+
+DELTA_MAX_ROWS = 1000
+DELTA_TOMBSTONE_DAYS = 7
+
+
+##### models.py
+class CompteurModification(models.Model):
+    cm_valeur = models.BigIntegerField(default=0)
+    # Estampille de la dernière pierre tombale purgée : un curseur plus
+    # ancien a pu rater des suppressions
+    cm_purge = models.BigIntegerField(default=0)
+
+
+class SuppressionSuivi(models.Model):
+    ss_modele = models.CharField(max_length=20)   # "suiviinstall" / "cartographie"
+    ss_objet_id = models.IntegerField()
+    ss_stamp = models.BigIntegerField(db_index=True)
+    ss_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+# class SuiviInstall(models.Model):
+#     ...
+#     su_stamp = models.BigIntegerField(default=0, db_index=True)
+#
+# class Cartographie(models.Model):
+#     ...
+#     ca_stamp = models.BigIntegerField(default=0, db_index=True)
+
+
+##### stamps
+# next_stamp / current_stamp / stamp_cells : voir suivi.py
+from .suivi import current_stamp, next_stamp, stamp_cells
+
+
+_STAMP_FIELDS = {SuiviInstall: 'su_stamp', Cartographie: 'ca_stamp'}
+
+
+@receiver(post_save, sender=SuiviInstall)
+@receiver(post_save, sender=Cartographie)
+def stamp_on_save(sender, instance, **kwargs):
+    # UPDATE séparé : fonctionne aussi avec save(update_fields=[...])
+    field = _STAMP_FIELDS[sender]
+    # Compteur et estampille dans la même transaction (verrou court en autocommit)
+    with transaction.atomic():
+        stamp = next_stamp()
+        sender.objects.filter(pk=instance.pk).update(**{field: stamp})
+        if sender is SuiviInstall:
+            stamp_cells([instance.pk], stamp)
+    setattr(instance, field, stamp)
+
+
+@receiver(post_delete, sender=SuiviInstall)
+@receiver(post_delete, sender=Cartographie)
+def stamp_on_delete(sender, instance, **kwargs):
+    with transaction.atomic():
+        SuppressionSuivi.objects.create(
+            ss_modele=sender._meta.model_name,
+            ss_objet_id=instance.pk,
+            ss_stamp=next_stamp(),
+        )
+
+
+def purge_suppressions(days=DELTA_TOMBSTONE_DAYS):
+    """
+    Supprime les pierres tombales de plus de ``days`` jours. Un client dont
+    le curseur est antérieur à la purge reçoit reset=True.
+
+    :return: nombre de pierres tombales supprimées
+    """
+    limit = timezone.now() - timedelta(days=days)
+    with transaction.atomic():
+        horizon = SuppressionSuivi.objects.filter(ss_date__lt=limit).aggregate(m=Max('ss_stamp'))['m']
+        if horizon is None:
+            return 0
+        CompteurModification.objects.get_or_create(pk=1)
+        CompteurModification.objects.filter(pk=1, cm_purge__lt=horizon).update(cm_purge=horizon)
+        deleted, _detail = SuppressionSuivi.objects.filter(ss_stamp__lte=horizon).delete()
+    return deleted
+
+
+##### vue
+def _carto_cells(queryset):
+    """Cellules de la grille au format de get_cartographie_from_carto (+ lot, contexte)."""
+    cells = []
+    for c in queryset.select_related(
+        'ca_lot', 'ca_contexte', 'ca_last_mantis__su_statut', 'ca_previous_mantis'
+    ):
+        last = c.ca_last_mantis
+        cells.append({
+            'id': c.pk,
+            'lot': c.ca_lot.l_name,
+            'contexte': c.ca_contexte.c_name,
+            'ticket': last.su_mantis if last else None,
+            'statut': last.su_statut.s_name if last and last.su_statut else None,
+            'color': last.su_statut.s_color if last and last.su_statut else None,
+            'date': last.su_phase_date.strftime('%d/%m/%Y') if last and last.su_phase_date else None,
+            'prev_ticket': c.ca_previous_mantis.su_mantis if c.ca_previous_mantis else None,
+        })
+    return cells
+
+
+def changes_since(since, categorie=None):
+    """
+    Modifications postérieures à ``since``.
+    Trop de changements (ou pas de curseur) : reset=True, le client recharge tout.
+
+    :param categorie: (Optionnel) seules les installations / cellules des
+        contextes de cette catégorie (celle affichée par la page) sont
+        renvoyées ; les suppressions ne sont pas filtrées (ids inconnus ignorés)
+    """
+    purge = CompteurModification.objects.filter(pk=1).values_list('cm_purge', flat=True).first() or 0
+    if not since or since < purge:
+        return {'cursor': current_stamp(), 'reset': True}
+
+    result = {'cursor': since, 'reset': False}
+
+    for model, field, key, contexte in ((SuiviInstall, 'su_stamp', 'suiviinstall', 'su_contexte'),
+                                       (Cartographie, 'ca_stamp', 'cartographie', 'ca_contexte')):
+        changed = model.objects.filter(**{field + '__gt': since}).order_by(field)
+        if categorie:
+            changed = changed.filter(**{contexte + '__c_category': categorie})
+        stamps = list(changed.values_list('id', field)[:DELTA_MAX_ROWS + 1])
+        deleted = list(
+            SuppressionSuivi.objects
+            .filter(ss_modele=key, ss_stamp__gt=since)
+            .values_list('ss_objet_id', 'ss_stamp')[:DELTA_MAX_ROWS + 1]
+        )
+        if len(stamps) > DELTA_MAX_ROWS or len(deleted) > DELTA_MAX_ROWS:
+            return {'cursor': current_stamp(), 'reset': True}
+
+        ids = [pk for pk, _stamp in stamps]
+        if model is SuiviInstall:
+            keys = list(API_FIELDS)
+            upserts = [
+                dict(zip(keys, r))
+                for r in SuiviInstall.objects.filter(id__in=ids).values_list(*API_FIELDS.values())
+            ]
+            _attach_lots(upserts)
+        else:
+            upserts = _carto_cells(Cartographie.objects.filter(id__in=ids))
+
+        result[key] = {'upserts': upserts, 'deletes': [pk for pk, _stamp in deleted]}
+        result['cursor'] = max([result['cursor']] + [s for _pk, s in stamps] + [s for _pk, s in deleted])
+
+    return result
+
+
+def changes_api(request):
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return HttpResponseBadRequest("since invalide")
+    return JsonResponse(changes_since(since, request.GET.get('categorie') or None))
+
+# urls.py :
+# path("api/changes/", changes_api, name="api_changes"),
+# GET /api/changes/?since=1234&categorie=P : delta limité à la catégorie affichée
+
+
+##### management/commands/purge_suppressions.py (à planifier chaque nuit)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Supprime les pierres tombales du flux delta plus anciennes que --days jours"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=DELTA_TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = purge_suppressions(options["days"])
+        self.stdout.write(self.style.SUCCESS("%d pierre(s) tombale(s) supprimée(s)" % deleted))
+
+
+##### tests.py
+from django.test import TestCase
+
+from .models import Cartographie, Contexte, Lot, Statut, SuiviInstall
+
+
+class ChangesSinceTests(TestCase):
+
+    def setUp(self):
+        contexte = Contexte.objects.create(c_name="ENV01", c_category=Contexte.CATEGORY[0][0])
+        lot = Lot.objects.create(l_name="Lot 001", l_version="9.1.0")
+        self.livre = Statut.objects.create(s_name="Livré", s_color="#00ff00")
+        a_tester = Statut.objects.create(s_name="A tester", s_color="#ffff00")
+        self.install = SuiviInstall.objects.create(su_mantis=40001, su_contexte=contexte, su_statut=a_tester)
+        self.cell = Cartographie.objects.create(ca_lot=lot, ca_contexte=contexte, ca_last_mantis=self.install)
+        self.autre_categorie = Contexte.objects.create(c_name="ENV02", c_category=Contexte.CATEGORY[1][0])
+
+    def test_statut_seul_emet_la_cellule(self):
+        cursor = current_stamp()
+        # La cellule pointe toujours sur la même installation, seul le statut change
+        self.install.su_statut = self.livre
+        self.install.save(update_fields=["su_statut"])
+
+        changes = changes_since(cursor)
+        cells = {c["id"]: c for c in changes["cartographie"]["upserts"]}
+        self.assertIn(self.cell.pk, cells)
+        self.assertEqual(cells[self.cell.pk]["statut"], "Livré")
+        self.assertEqual(cells[self.cell.pk]["color"], "#00ff00")
+        self.assertGreater(changes["cursor"], cursor)
+
+    def test_filtre_par_categorie(self):
+        cursor = current_stamp()
+        SuiviInstall.objects.create(su_mantis=40002, su_contexte=self.autre_categorie, su_statut=self.livre)
+
+        categorie = self.install.su_contexte.c_category
+        self.assertEqual(changes_since(cursor, categorie)["suiviinstall"]["upserts"], [])
+        self.assertEqual(len(changes_since(cursor)["suiviinstall"]["upserts"]), 1)
+
+    def test_curseur_plus_ancien_que_la_purge(self):
+        cursor = current_stamp()
+        install_id = self.install.pk
+        self.install.delete()
+        self.assertEqual(changes_since(cursor)["suiviinstall"]["deletes"], [install_id])
+
+        # Une pierre tombale par ligne supprimée : la cellule aussi si la FK
+        # de Cartographie est en CASCADE
+        tombstones = SuppressionSuivi.objects.count()
+        self.assertGreaterEqual(tombstones, 1)
+        old = timezone.now() - timedelta(days=DELTA_TOMBSTONE_DAYS + 1)
+        SuppressionSuivi.objects.update(ss_date=old)
+        self.assertEqual(purge_suppressions(), tombstones)
+        self.assertTrue(changes_since(cursor)["reset"])
+
+########
+# Import de l'onglet "EnCours" (remplace les macros VBA ExportExcelToJSON_Groupe)
+# Même regroupement que macro2 :
+# - colonne B = lot (les lignes commençant par "^" ne changent pas de lot),
+# - colonne D = "version:analyse", version vide => "NewLot",
+# - pour une même version d'un lot, la dernière ligne gagne.
+# Le classeur est lu en streaming (read_only) puis les Lot / SuiviLotVersion
+# sont créés ou mis à jour par lots : relancer l'import ne change rien.
+from openpyxl import load_workbook
+
+from .suivi import version_sort_key
+
+ENCOURS_SHEET = "EnCours"
+NEW_LOT = "NewLot"
+IMPORT_BATCH_SIZE = 500
+
+# colonne Excel (1 = A) -> clé du JSON produit par la macro
+ENCOURS_COLUMNS = OrderedDict([
+    (6, "Ancienne version"),
+    (4, "Analyse"),
+    (5, "TicketInstallation"),
+    (7, "Date d'analyse"),
+    (8, "TicketOuvert"),
+    (10, "TicketFerme"),
+    (9, "Statut"),
+    (11, "TRI"),
+])
+
+
+def _cell_text(value):
+    """Équivalent de Trim(CStr(cell)) : 48431.0 -> '48431', date -> '18/03/2026'."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%d/%m/%Y")
+    return str(value).strip()
+
+
+def _tickets(value):
+    return [t.strip() for t in _cell_text(value).split(",") if t.strip()]
+
+
+def read_encours(path, sheet=ENCOURS_SHEET):
+    """
+    Lit l'onglet "EnCours" et regroupe les lignes par lot puis par version.
+
+    :return: OrderedDict {lot: OrderedDict {version: {...}}}, mêmes clés que
+             le JSON des macros (TicketOuvert / TicketFerme en listes)
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet].iter_rows(min_row=2, max_col=max(ENCOURS_COLUMNS), values_only=True)
+        lots = OrderedDict()
+        versions = None
+        for row in rows:
+            row = row + (None,) * (max(ENCOURS_COLUMNS) - len(row))
+            lot = _cell_text(row[1])
+            if lot and not lot.startswith("^"):
+                versions = lots.setdefault(lot, OrderedDict())
+            if versions is None:
+                continue
+
+            version, sep, analyse = _cell_text(row[3]).partition(":")
+            if not sep:
+                continue
+            version = version.strip() or NEW_LOT
+
+            data = OrderedDict()
+            for col, key in ENCOURS_COLUMNS.items():
+                value = row[col - 1]
+                if key == "Analyse":
+                    data[key] = analyse.strip()
+                elif key in ("TicketOuvert", "TicketFerme"):
+                    data[key] = _tickets(value)
+                else:
+                    data[key] = _cell_text(value)
+            # Dernière ligne gagnante, mais la version garde sa place d'origine
+            versions[version] = data
+        return lots
+    finally:
+        workbook.close()
+
+
+def encours_to_json(path, sheet=ENCOURS_SHEET):
+    """Même export que la macro (sans la concaténation de chaînes)."""
+    return json.dumps(read_encours(path, sheet), ensure_ascii=False, indent=4)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _lot_ids(Lot, keys, batch_size, dry_run):
+    """
+    Ids des lots ``keys`` ((l_name, l_version)), en créant les lots manquants.
+
+    :return: ({(l_name, l_version): id}, nombre de lots manquants). En dry_run
+             rien n'est créé : les lots manquants sont comptés mais absents du dict.
+    """
+    ids = {}
+    names = {name for name, _version in keys}
+    for chunk in _chunks(names, batch_size):
+        for pk, name, version in Lot.objects.filter(l_name__in=chunk).values_list("id", "l_name", "l_version"):
+            ids.setdefault((name, version), pk)
+
+    missing = [key for key in keys if key not in ids]
+    if missing and not dry_run:
+        Lot.objects.bulk_create(
+            [
+                Lot(l_name=name, l_version=version, l_version_key=version_sort_key(version))
+                for name, version in missing
+            ],
+            batch_size=batch_size,
+        )
+        # Relecture : bulk_create ne renvoie pas les id sur toutes les bases
+        for chunk in _chunks({name for name, _version in missing}, batch_size):
+            for pk, name, version in Lot.objects.filter(l_name__in=chunk).values_list("id", "l_name", "l_version"):
+                ids.setdefault((name, version), pk)
+    return ids, len(missing)
+
+
+def import_encours(lots, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Importe le résultat de read_encours() dans Lot / SuiviLotVersion, de façon idempotente.
+
+    - un Lot par (lot, version) ; la version "NewLot" est stockée en l_version vide,
+    - une SuiviLotVersion par (lot, TicketInstallation) : créée si absente,
+      mise à jour (si_is_new_lot, si_precedent) si elle a changé, sinon ignorée,
+    - les lignes sans TicketInstallation ne donnent que le Lot,
+    - une cellule TicketInstallation qui n'est pas un seul numéro (ex: "48431, 48432")
+      ne donne que le Lot et est listée dans ``skipped_cells``.
+
+    :return: dict de compteurs (lots, lots_created, created, updated, unchanged,
+             skipped, seconds) et ``skipped_cells`` : ["lot@version : cellule", ...]
+    """
+    start = time.perf_counter()
+    Lot = SuiviLotVersion._meta.get_field("si_lot").related_model
+
+    # (lot, version, mantis, ancienne version)
+    lignes = []
+    skipped_cells = []
+    for lot, versions in lots.items():
+        for version, data in versions.items():
+            mantis = data["TicketInstallation"]
+            if mantis and not mantis.isdigit():
+                skipped_cells.append("%s@%s : %s" % (lot, version, mantis))
+            lignes.append((
+                lot,
+                "" if version == NEW_LOT else version,
+                int(mantis) if mantis.isdigit() else None,
+                data["Ancienne version"],
+            ))
+
+    stats = {"lots": 0, "lots_created": 0, "created": 0, "updated": 0, "unchanged": 0,
+             "skipped": len(skipped_cells), "skipped_cells": skipped_cells}
+    with transaction.atomic():
+        keys = {(lot, version) for lot, version, _mantis, _ancienne in lignes}
+        keys |= {(lot, ancienne) for lot, _version, _mantis, ancienne in lignes if ancienne}
+        lot_ids, stats["lots_created"] = _lot_ids(Lot, keys, batch_size, dry_run)
+        stats["lots"] = len(keys)
+
+        # Dernière SuiviLotVersion (plus grand id) par (lot, mantis), comme latest_lot_versions()
+        existing = {}
+        known_ids = [pk for pk in lot_ids.values() if pk is not None]
+        for chunk in _chunks(known_ids, batch_size):
+            for pk, lot_id, mantis, is_new_lot, precedent_id in (
+                SuiviLotVersion.objects
+                .filter(si_lot_id__in=chunk)
+                .order_by("id")
+                .values_list("id", "si_lot_id", "si_installation_mantis", "si_is_new_lot", "si_precedent_id")
+            ):
+                existing[(lot_id, mantis)] = (pk, is_new_lot, precedent_id)
+
+        to_create, to_update = {}, []
+        for lot, version, mantis, ancienne in lignes:
+            if mantis is None:
+                continue
+            lot_id = lot_ids.get((lot, version))
+            values = {
+                "si_is_new_lot": version == "",
+                "si_precedent_id": lot_ids.get((lot, ancienne)) if ancienne else None,
+            }
+            current = existing.get((lot_id, mantis)) if lot_id is not None else None
+            if current is None:
+                to_create[(lot, version, mantis)] = values
+            elif (current[1], current[2]) != (values["si_is_new_lot"], values["si_precedent_id"]):
+                to_update.append(SuiviLotVersion(id=current[0], **values))
+            else:
+                stats["unchanged"] += 1
+
+        stats["created"] = len(to_create)
+        stats["updated"] = len(to_update)
+        if not dry_run:
+            SuiviLotVersion.objects.bulk_create(
+                [
+                    SuiviLotVersion(si_lot_id=lot_ids[(lot, version)], si_installation_mantis=mantis, **values)
+                    for (lot, version, mantis), values in to_create.items()
+                ],
+                batch_size=batch_size,
+            )
+            SuiviLotVersion.objects.bulk_update(
+                to_update, ["si_is_new_lot", "si_precedent_id"], batch_size=batch_size
+            )
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+##### management/commands/import_encours.py
+# python manage.py import_encours suivi_18032026.xlsm [--json export.json] [--dry-run]
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Importe l'onglet EnCours d'un classeur de suivi dans Lot / SuiviLotVersion"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Classeur .xlsx / .xlsm")
+        parser.add_argument("--sheet", default=ENCOURS_SHEET)
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--json", help="Écrit aussi l'export JSON de la macro dans ce fichier")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        lots = read_encours(options["path"], options["sheet"])
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump(lots, f, ensure_ascii=False, indent=4)
+
+        stats = import_encours(
+            lots,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "EnCours : %(lots)d lot(s)/version(s) dont %(lots_created)d créé(s), "
+            "SuiviLotVersion %(created)d créée(s), %(updated)d mise(s) à jour, "
+            "%(unchanged)d inchangée(s), %(skipped)d cellule(s) ticket ignorée(s) "
+            "en %(seconds).2f s" % stats
+        ))
+        for cell in stats["skipped_cells"]:
+            self.stdout.write(self.style.WARNING("Ticket non importé (un seul numéro attendu) : %s" % cell))
+
+########
+# DataTables en mode "serverSide" pour le tableau #suivinstallation (voir select)
+# GET /api/suivi/datatable/?draw=1&start=0&length=50&search[value]=...
+#     &order[0][column]=7&order[0][dir]=desc&columns[5][search][value]=ENV001
+#     &minDate=2025-01-01&maxDate=2025-12-31
+# Réponse : {"draw": 1, "recordsTotal": n, "recordsFiltered": m, "data": [...]}
+# Le tri, la recherche, les listes déroulantes et la plage de dates sont
+# traités en SQL : le navigateur ne reçoit que la page affichée.
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+DT_MAX_LENGTH = 500
+DT_CACHE_TIMEOUT = 10 * 60
+
+# (clé "data" DataTables, champ ORM), dans l'ordre des colonnes du tableau
+DT_COLUMNS = [
+    ('mantis', 'su_mantis'),
+    ('description', 'su_description'),
+    ('type', 'su_type_installation'),
+    ('statut', 'su_statut__s_name'),
+    ('client', 'su_contexte__c_category'),   # adapte selon ton tableau
+    ('contexte', 'su_contexte__c_name'),
+    ('reception', 'su_reception_date'),
+    ('livraison', 'su_delivery_date'),
+]
+DT_DATE_COLUMN = 'su_delivery_date'
+# Colonnes filtrées par liste déroulante (valeur exacte)
+DT_FACETS = ['client', 'contexte']
+# Colonnes parcourues par la recherche globale
+DT_SEARCH_FIELDS = ['su_description', 'su_type_installation', 'su_statut__s_name', 'su_contexte__c_name']
+
+_DT_FIELDS = dict(DT_COLUMNS)
+
+
+##### models.py
+# class SuiviInstall(models.Model):
+#     ...
+#     class Meta:
+#         indexes = [
+#             ...,
+#             models.Index(fields=["su_delivery_date"], name="suivi_delivery_date"),
+#         ]
+#
+# migrations/00XX_suivi_delivery_date.py :
+#     operations = [
+#         migrations.AddIndex(
+#             model_name="suiviinstall",
+#             index=models.Index(fields=["su_delivery_date"], name="suivi_delivery_date"),
+#         ),
+#     ]
+
+
+def _dt_cached(name, compute):
+    """
+    Valeur mise en cache jusqu'à la prochaine modification d'une installation
+    (la clé contient l'estampille du flux delta, voir current_stamp()).
+    """
+    key = 'dt:%s:%s' % (name, current_stamp())
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, DT_CACHE_TIMEOUT)
+    return value
+
+
+def datatable_facets():
+    """Valeurs distinctes des colonnes à liste déroulante : {data: [valeurs triées]}."""
+    def compute():
+        return {
+            name: [
+                v for v in SuiviInstall.objects
+                .order_by(_DT_FIELDS[name])
+                .values_list(_DT_FIELDS[name], flat=True)
+                .distinct()
+                if v not in (None, '')
+            ]
+            for name in DT_FACETS
+        }
+    return _dt_cached('facets', compute)
+
+
+def _date_range(min_date, max_date):
+    """Plage [min, max] (jours inclus) en bornes sur le champ brut : l'index reste utilisable."""
+    q = Q()
+    if min_date:
+        q &= Q(**{DT_DATE_COLUMN + '__gte': _debut_jour(min_date)})
+    if max_date:
+        q &= Q(**{DT_DATE_COLUMN + '__lt': _debut_jour(max_date + timedelta(days=1))})
+    return q
+
+
+def _debut_jour(day):
+    value = datetime.combine(day, datetime.min.time())
+    if settings.USE_TZ:
+        value = timezone.make_aware(value)
+    return value
+
+
+def _dt_date(value):
+    """datetime -> 'dd/mm/yyyy' (format affiché jusqu'ici dans le tableau)."""
+    if value is None:
+        return None
+    if settings.USE_TZ:
+        value = timezone.localtime(value)
+    return value.strftime('%d/%m/%Y')
+
+
+def _dt_param_date(querydict, name):
+    value = querydict.get(name) or None
+    if value is None:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError("%s invalide : %r" % (name, value))
+    return day
+
+
+def datatable_page(params):
+    """
+    Applique le protocole DataTables (search / columns / order / start / length)
+    à SuiviInstall.
+
+    :param params: QueryDict de la requête
+    :return: dict prêt à être renvoyé en JSON
+    """
+    queryset = SuiviInstall.objects.all()
+    total = _dt_cached('total', queryset.count)
+
+    # Listes déroulantes : valeur exacte
+    for i, (name, field) in enumerate(DT_COLUMNS):
+        value = params.get('columns[%d][search][value]' % i)
+        if value and name in DT_FACETS:
+            queryset = queryset.filter(**{field: value})
+
+    queryset = queryset.filter(_date_range(
+        _dt_param_date(params, 'minDate'),
+        _dt_param_date(params, 'maxDate'),
+    ))
+
+    # Recherche globale
+    search = (params.get('search[value]') or '').strip()
+    if search:
+        q = Q()
+        for field in DT_SEARCH_FIELDS:
+            q |= Q(**{field + '__icontains': search})
+        if search.isdigit():
+            q |= Q(su_mantis=int(search))
+        queryset = queryset.filter(q)
+
+    filtered = queryset.count() if (queryset.query.where or search) else total
+
+    # Tri (plusieurs colonnes possibles), id en dernier pour une pagination stable
+    ordering = []
+    i = 0
+    while 'order[%d][column]' % i in params:
+        name, field = DT_COLUMNS[int(params['order[%d][column]' % i])]
+        desc = params.get('order[%d][dir]' % i) == 'desc'
+        ordering.append(F(field).desc(nulls_last=True) if desc else F(field).asc(nulls_last=True))
+        i += 1
+    ordering.append('-id')
+
+    start = max(int(params.get('start', 0)), 0)
+    length = int(params.get('length', 50))
+    if length < 0 or length > DT_MAX_LENGTH:
+        length = DT_MAX_LENGTH
+
+    keys = [name for name, _field in DT_COLUMNS]
+    data = []
+    for values in queryset.order_by(*ordering).values_list(*_DT_FIELDS.values())[start:start + length]:
+        row = dict(zip(keys, values))
+        row['reception'] = _dt_date(row['reception'])
+        row['livraison'] = _dt_date(row['livraison'])
+        data.append(row)
+
+    return {
+        # draw est renvoyé tel quel par DataTables : on le force en entier
+        'draw': int(params.get('draw', 0)),
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': data,
+    }
+
+
+def datatable_api(request):
+    try:
+        return JsonResponse(datatable_page(request.GET))
+    except (ValueError, IndexError) as e:
+        return HttpResponseBadRequest(str(e))
+
+
+def datatable_facets_api(request):
+    return JsonResponse(datatable_facets())
+
+# urls.py :
+# path("api/suivi/datatable/", datatable_api, name="api_suivi_datatable"),
+# path("api/suivi/datatable/facets/", datatable_facets_api, name="api_suivi_datatable_facets"),
+
+
 ########
 from django.contrib.auth.views import PasswordChangeView
 from django.contrib.auth import update_session_auth_hash
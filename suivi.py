@@ -0,0 +1,879 @@
+# -*- coding: utf-8 -*-
+"""
+Requêtes suivi / cartographie, importables telles quelles.
+
+Les fichiers example.py, requzte.py et cartographie sont des recueils
+d'extraits (modèles, signaux, migrations, vues) à recopier dans l'application ;
+les fonctions qu'ils partagent, et que benchmark.py mesure, sont ici :
+
+- versions de lot comparables (``version_sort_key``),
+- estampilles du flux delta (``next_stamp``, ``stamp_cells``),
+- version du cache de la grille (``invalidate_cartographie_cache``),
+- phases de statut (``phase_for_status_name``, ``refresh_phase_dates``),
+- table Cartographie (``get_cartographie_from_carto``, ``rebuild_cartographie``...),
+- cartographie en une requête (``get_cartographie_single_pass``),
+- statistiques mensuelles (``GroupConcat``, ``get_installations_stats``),
+- listing / export des installations (``iter_installations_chunks``, ``ecrire_export_mantis``),
+- installations + lots en JSON (``get_installations_with_lots_json``).
+"""
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Aggregate, CharField, Count, F, Max, Q, Value, Window
+from django.db.models.functions import Concat, RowNumber, TruncDate, TruncMonth
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
+from openpyxl.utils import get_column_letter
+
+from .instrumentation import timed
+from .models import (
+    Cartographie, CompteurModification, Contexte, SuiviInstall, SuiviLotVersion,
+)
+
+
+##### Versions de lot comparables ("9.2.10" > "9.2.2")
+VERSION_PARTS = 4      # 9.2.10 -> (9, 2, 10, 0)
+VERSION_DIGITS = 5     # jusqu'à 99999 par composant
+VERSION_KEY_LENGTH = VERSION_PARTS * (VERSION_DIGITS + 1) - 1
+
+_VERSION_NUMBERS = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=8192)
+def parse_version(version):
+    """
+    '9.2.10' -> (9, 2, 10). Seuls les nombres comptent ('V9.2-RC1' -> (9, 2, 1)).
+    Une version vide ou sans nombre ('NewLot') donne () : elle est plus petite
+    que toutes les autres.
+    """
+    return tuple(int(n) for n in _VERSION_NUMBERS.findall(version or ""))
+
+
+@lru_cache(maxsize=8192)
+def version_sort_key(version):
+    """'9.2.10' -> '00009.00002.00010.00000' (même ordre que parse_version)."""
+    parts = parse_version(version)[:VERSION_PARTS]
+    parts += (0,) * (VERSION_PARTS - len(parts))
+    return ".".join(str(min(n, 10 ** VERSION_DIGITS - 1)).zfill(VERSION_DIGITS) for n in parts)
+
+
+##### Estampilles du flux delta
+def next_stamp():
+    """
+    Nouvelle estampille. À appeler dans la transaction qui écrit l'estampille
+    (transaction.atomic()) : hors transaction, le compteur serait commité
+    avant la ligne et un client pourrait lire N+1 avant N.
+    """
+    with transaction.atomic():
+        if not CompteurModification.objects.filter(pk=1).update(cm_valeur=F('cm_valeur') + 1):
+            CompteurModification.objects.get_or_create(pk=1)
+            CompteurModification.objects.filter(pk=1).update(cm_valeur=F('cm_valeur') + 1)
+        return CompteurModification.objects.values_list('cm_valeur', flat=True).get(pk=1)
+
+
+def current_stamp():
+    return CompteurModification.objects.filter(pk=1).values_list('cm_valeur', flat=True).first() or 0
+
+
+def stamp_cells(installs, stamp):
+    """
+    Estampille les cellules Cartographie qui affichent ces installations
+    (ids ou queryset) : statut, couleur et date viennent de l'installation,
+    la cellule doit repartir dans le flux même si elle pointe toujours
+    sur les mêmes installations.
+    """
+    return Cartographie.objects.filter(
+        Q(ca_last_mantis__in=installs) | Q(ca_previous_mantis__in=installs)
+    ).update(ca_stamp=stamp)
+
+
+##### Version du cache de la grille Lot x Contexte
+CARTO_VERSION_KEY = "carto:version"
+
+
+def get_cartographie_version():
+    version = cache.get(CARTO_VERSION_KEY)
+    if version is None:
+        # Clé absente (démarrage, éviction) : on repart d'un horodatage en ms
+        # pour ne jamais retomber sur une ancienne version encore en cache
+        cache.add(CARTO_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(CARTO_VERSION_KEY)
+    return version
+
+
+def invalidate_cartographie_cache(**kwargs):
+    """Invalide la grille de toutes les catégories (utilisable comme receiver)."""
+    try:
+        cache.incr(CARTO_VERSION_KEY)
+    except ValueError:
+        cache.set(CARTO_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+##### Phases de statut et date de phase dénormalisée
+PHASE_ANALYSE = 1
+PHASE_PRISE = 2
+PHASE_INSTALL = 3
+PHASE_TEST = 4
+PHASE_LIVRAISON = 5
+PHASE_ATTENTE = 6
+PHASE_RECEPTION = 7
+
+PHASES = [
+    (PHASE_ANALYSE, "Analyse"),
+    (PHASE_PRISE, "Prise en compte"),
+    (PHASE_INSTALL, "Installation"),
+    (PHASE_TEST, "Test"),
+    (PHASE_LIVRAISON, "Livraison"),
+    (PHASE_ATTENTE, "Attente"),
+    (PHASE_RECEPTION, "Réception"),
+]
+
+PHASE_DATE_FIELDS = {
+    PHASE_ANALYSE: "su_analyse_date",
+    PHASE_PRISE: "su_taken_date",
+    PHASE_INSTALL: "su_install_date",
+    PHASE_TEST: "su_test_date",
+    PHASE_LIVRAISON: "su_delivery_date",
+    PHASE_ATTENTE: "su_standby_date",
+    PHASE_RECEPTION: "su_reception_date",
+}
+
+# Mêmes règles (et même ordre) que l'ancien CASE sur s_name__icontains
+PHASE_KEYWORDS = [
+    ("analyse", PHASE_ANALYSE),
+    ("prise", PHASE_PRISE),
+    ("install", PHASE_INSTALL),
+    ("test", PHASE_TEST),
+    ("livr", PHASE_LIVRAISON),
+    ("attente", PHASE_ATTENTE),
+    ("récep", PHASE_RECEPTION),
+]
+
+
+def phase_for_status_name(name):
+    """Code de phase d'un nom de statut (None si aucun mot-clé ne correspond)."""
+    name = (name or "").lower()
+    for keyword, phase in PHASE_KEYWORDS:
+        if keyword in name:
+            return phase
+    return None
+
+
+def refresh_phase_dates(queryset=None):
+    """
+    Recalcule su_phase_date en base : un UPDATE par phase, sans rien
+    charger en Python.
+    """
+    queryset = SuiviInstall.objects.all() if queryset is None else queryset
+    # update() ne passe pas par les signaux : estampille posée ici (flux delta),
+    # y compris sur les cellules qui affichent la date de ces installations
+    with transaction.atomic():
+        stamp = next_stamp()
+        updated = queryset.filter(su_statut__s_phase__isnull=True).update(su_phase_date=None, su_stamp=stamp)
+        for phase, field in PHASE_DATE_FIELDS.items():
+            updated += queryset.filter(su_statut__s_phase=phase).update(su_phase_date=F(field), su_stamp=stamp)
+        stamp_cells(queryset.values("pk"), stamp)
+    return updated
+
+
+##### Ordre des statuts
+STATUT_ORDER_DEFAULT = 99
+
+# Ordre historique (ancien CASE)
+STATUT_SORT_ORDERS = {
+    "en attente": 1,
+    "a faire": 2,
+    "en cours": 3,
+    "terminée": 4,
+}
+
+
+##### Table Cartographie : lecture et maintenance
+def get_cartographie_from_carto(categorie):
+    """
+    Cartographie Lot x Contexte à partir de la table Cartographie
+    """
+    queryset = (
+        Cartographie.objects
+        .select_related(
+            "ca_lot",
+            "ca_contexte",
+            "ca_last_mantis__su_statut",
+            "ca_previous_mantis"
+        )
+        .filter(ca_contexte__c_category=categorie)
+        .annotate(
+            # Date affichée selon la phase du statut, précalculée sur
+            # SuiviInstall (su_phase_date, voir plus haut)
+            display_date=F("ca_last_mantis__su_phase_date"),
+
+            # Champs utiles
+            lot_name=F("ca_lot__l_name"),
+            contexte=F("ca_contexte__c_name"),
+            ticket=F("ca_last_mantis__su_mantis"),
+            prev_ticket=F("ca_previous_mantis__su_mantis"),
+            statut=F("ca_last_mantis__su_statut__s_name"),
+            color=F("ca_last_mantis__su_statut__s_color"),
+        )
+        .order_by("contexte", "lot_name")
+    )
+
+    # --------------------------------------------------
+    # Construction Lot = ligne / Contexte = colonne
+    # --------------------------------------------------
+    rows = OrderedDict()
+
+    for row in queryset:
+        lot = row.lot_name
+        ctx = row.contexte
+
+        if lot not in rows:
+            rows[lot] = {"lot": lot}
+
+        rows[lot][ctx] = {
+            "ticket": row.ticket,
+            "statut": row.statut,
+            "color": row.color,
+            "date": (
+                row.display_date.strftime("%d/%m/%Y")
+                if row.display_date else None
+            ),
+            "prev_ticket": row.prev_ticket,
+            "id": row.pk,
+        }
+
+    return list(rows.values())
+
+
+CARTO_STATUTS_EXCLUS = ["annul", "rejet", "refus", "abandon"]
+CARTO_BATCH_SIZE = 1000
+
+
+def _top2_par_cellule(contexte_ids, lot_names=None):
+    """
+    Les 2 installations à afficher pour chaque cellule, calculées en SQL :
+    version du lot la plus haute d'abord, puis date de réception la plus récente.
+
+    :return: {(lot_name, contexte_id): [(lot_id, install_id), (lot_id, install_id) | None]}
+    """
+    Through = SuiviInstall.su_lots.through
+
+    queryset = Through.objects.filter(suiviinstall__su_contexte_id__in=contexte_ids)
+    if lot_names is not None:
+        queryset = queryset.filter(lot__l_name__in=lot_names)
+    if CARTO_STATUTS_EXCLUS:
+        exclus = Q()
+        for keyword in CARTO_STATUTS_EXCLUS:
+            exclus |= Q(suiviinstall__su_statut__s_name__icontains=keyword)
+        queryset = queryset.exclude(exclus)
+
+    queryset = (
+        queryset
+        .annotate(
+            rang=Window(
+                RowNumber(),
+                partition_by=[F("suiviinstall__su_contexte_id"), F("lot__l_name")],
+                order_by=[
+                    F("lot__l_version_key").desc(),
+                    F("suiviinstall__su_reception_date").desc(nulls_last=True),
+                    F("suiviinstall_id").desc(),
+                ],
+            )
+        )
+        .filter(rang__lte=2)
+        .values_list("lot__l_name", "suiviinstall__su_contexte_id", "lot_id", "suiviinstall_id", "rang")
+    )
+
+    cells = {}
+    for lot_name, contexte_id, lot_id, install_id, rang in queryset:
+        cells.setdefault((lot_name, contexte_id), [None, None])[rang - 1] = (lot_id, install_id)
+    return cells
+
+
+def _apply_cells(keys, top2, existing, batch_size=CARTO_BATCH_SIZE):
+    """
+    Aligne les lignes Cartographie de ``keys`` sur ``top2``.
+
+    :param keys: cellules (lot_name, contexte_id) à traiter
+    :param top2: résultat de _top2_par_cellule
+    :param existing: lignes Cartographie (select_related ca_lot) couvrant ``keys``
+    :return: dict {created, updated, deleted}
+    """
+    par_cellule = {}
+    a_supprimer = []
+    for carto in existing:
+        key = (carto.ca_lot.l_name, carto.ca_contexte_id)
+        if key not in keys:
+            continue
+        if key in par_cellule:
+            a_supprimer.append(carto.pk)   # doublon historique
+        else:
+            par_cellule[key] = carto
+
+    a_creer, a_modifier = [], []
+    for key in keys:
+        top = top2.get(key)
+        carto = par_cellule.get(key)
+
+        if top is None:
+            if carto is not None:
+                a_supprimer.append(carto.pk)
+            continue
+
+        lot_id, last_id = top[0]
+        previous_id = top[1][1] if top[1] else None
+
+        if carto is None:
+            a_creer.append(Cartographie(
+                ca_lot_id=lot_id,
+                ca_contexte_id=key[1],
+                ca_last_mantis_id=last_id,
+                ca_previous_mantis_id=previous_id,
+            ))
+        elif (carto.ca_lot_id, carto.ca_last_mantis_id, carto.ca_previous_mantis_id) != (lot_id, last_id, previous_id):
+            carto.ca_lot_id = lot_id
+            carto.ca_last_mantis_id = last_id
+            carto.ca_previous_mantis_id = previous_id
+            a_modifier.append(carto)
+
+    with transaction.atomic():
+        if a_supprimer:
+            Cartographie.objects.filter(pk__in=a_supprimer).delete()
+        if a_modifier or a_creer:
+            # Même estampille pour tout le lot (flux delta, voir requzte.py)
+            stamp = next_stamp()
+            for carto in a_modifier + a_creer:
+                carto.ca_stamp = stamp
+        if a_modifier:
+            Cartographie.objects.bulk_update(
+                a_modifier,
+                ["ca_lot", "ca_last_mantis", "ca_previous_mantis", "ca_stamp"],
+                batch_size=batch_size,
+            )
+        if a_creer:
+            Cartographie.objects.bulk_create(a_creer, batch_size=batch_size)
+        if a_supprimer or a_modifier or a_creer:
+            # bulk_* n'envoie pas de signaux : on invalide la grille à la main
+            transaction.on_commit(invalidate_cartographie_cache)
+
+    return {"created": len(a_creer), "updated": len(a_modifier), "deleted": len(a_supprimer)}
+
+
+def refresh_cartographie_cells(cells):
+    """
+    Recalcule uniquement les cellules données.
+
+    :param cells: itérable de (lot_name, contexte_id)
+    """
+    keys = set(cells)
+    if not keys:
+        return {"created": 0, "updated": 0, "deleted": 0}
+
+    lot_names = {lot_name for lot_name, _ctx in keys}
+    contexte_ids = {ctx for _lot, ctx in keys}
+
+    top2 = _top2_par_cellule(contexte_ids, lot_names)
+    existing = Cartographie.objects.select_related("ca_lot").filter(
+        ca_contexte_id__in=contexte_ids,
+        ca_lot__l_name__in=lot_names,
+    )
+    return _apply_cells(keys, top2, existing)
+
+
+def rebuild_cartographie(batch_size=CARTO_BATCH_SIZE):
+    """
+    Reconstruction complète, contexte par contexte (mémoire bornée).
+    Rejouable : les lignes déjà à jour ne sont pas réécrites.
+    """
+    stats = {"created": 0, "updated": 0, "deleted": 0}
+
+    for contexte_id in Contexte.objects.order_by("pk").values_list("pk", flat=True):
+        top2 = _top2_par_cellule([contexte_id])
+        existing = list(Cartographie.objects.select_related("ca_lot").filter(ca_contexte_id=contexte_id))
+        keys = set(top2) | {(c.ca_lot.l_name, contexte_id) for c in existing}
+
+        for k, v in _apply_cells(keys, top2, existing, batch_size).items():
+            stats[k] += v
+
+    return stats
+
+
+##### Cartographie en une seule requête
+CARTO_STATUTS = [14, 12, 2, 11]
+
+
+def get_cartographie_single_pass():
+    """
+    Même résultat que get_cartographie(), mais en un seul aller-retour base :
+    la version max par (contexte, lot) est sélectionnée en SQL
+    (DISTINCT ON sous PostgreSQL, ROW_NUMBER() OVER (...) ailleurs).
+    """
+    categories = OrderedDict(Contexte.CATEGORY)
+    Through = SuiviInstall.su_lots.through
+
+    queryset = Through.objects.filter(
+        suiviinstall__su_statut__in=CARTO_STATUTS,
+        suiviinstall__su_contexte__c_category__in=list(categories),
+    )
+
+    if connection.vendor == "postgresql":
+        # 1 ligne par (contexte, lot) : la première selon l'ordre = version max
+        queryset = queryset.order_by(
+            "suiviinstall__su_contexte__c_name",
+            "lot__l_name",
+            "-lot__l_version_key",
+            "-suiviinstall_id",
+        ).distinct("suiviinstall__su_contexte__c_name", "lot__l_name")
+    else:
+        # Fallback portable (SQLite, ...) : fonction fenêtre, Django >= 4.2
+        queryset = queryset.annotate(
+            rang=Window(
+                RowNumber(),
+                # Par nom de lot (une ligne Lot par version), comme le DISTINCT ON
+                partition_by=[F("suiviinstall__su_contexte_id"), F("lot__l_name")],
+                order_by=[F("lot__l_version_key").desc(), F("suiviinstall_id").desc()],
+            )
+        ).filter(rang=1).order_by("suiviinstall__su_contexte__c_name", "lot__l_name")
+
+    queryset = queryset.values_list(
+        "suiviinstall__su_contexte__c_category",
+        "suiviinstall__su_contexte__c_name",
+        "lot__l_name",
+        "lot__l_version",
+        "suiviinstall__su_statut__s_name",
+        "suiviinstall__su_delivery_date",
+        "suiviinstall__su_mantis",
+    )
+
+    # Les lignes arrivent triées par contexte puis lot : on les range
+    # par catégorie pour garder l'ordre de Contexte.CATEGORY
+    par_categorie = OrderedDict((code, OrderedDict()) for code in categories)
+    for code, contexte_name, lot_name, version, statut, date_install, mantis in queryset:
+        lots = par_categorie[code].setdefault(contexte_name, OrderedDict())
+        lots[lot_name] = {
+            "Version": version,
+            "Categorie": categories[code],
+            "Statut": statut,
+            "Date_install": date_install,
+            "Mantis": mantis,
+        }
+
+    cartographie = OrderedDict()
+    for contextes in par_categorie.values():
+        cartographie.update(contextes)
+    return cartographie
+
+
+def get_cartographie_reference():
+    """
+    Référence naïve pour vérifier get_cartographie_single_pass() : toutes les
+    lignes sont lues et la version max par (contexte, nom de lot) est choisie
+    en Python, avec le même départage (clé de version puis id d'installation).
+    """
+    categories = OrderedDict(Contexte.CATEGORY)
+    Through = SuiviInstall.su_lots.through
+    rows = Through.objects.filter(
+        suiviinstall__su_statut__in=CARTO_STATUTS,
+        suiviinstall__su_contexte__c_category__in=list(categories),
+    ).values_list(
+        "suiviinstall__su_contexte__c_category",
+        "suiviinstall__su_contexte__c_name",
+        "lot__l_name",
+        "lot__l_version",
+        "lot__l_version_key",
+        "suiviinstall_id",
+        "suiviinstall__su_statut__s_name",
+        "suiviinstall__su_delivery_date",
+        "suiviinstall__su_mantis",
+    )
+
+    best = {}
+    for code, contexte_name, lot_name, version, version_key, install_id, statut, date_install, mantis in rows:
+        key = (contexte_name, lot_name)
+        rank = (version_key, install_id)
+        if key not in best or rank > best[key][0]:
+            best[key] = (rank, code, {
+                "Version": version,
+                "Categorie": categories[code],
+                "Statut": statut,
+                "Date_install": date_install,
+                "Mantis": mantis,
+            })
+
+    par_categorie = OrderedDict((code, OrderedDict()) for code in categories)
+    for (contexte_name, lot_name), (_rank, code, value) in sorted(best.items()):
+        par_categorie[code].setdefault(contexte_name, OrderedDict())[lot_name] = value
+
+    cartographie = OrderedDict()
+    for contextes in par_categorie.values():
+        cartographie.update(contextes)
+    return cartographie
+
+
+##### Statistiques mensuelles
+class GroupConcat(Aggregate):
+    """
+    GROUP_CONCAT (SQLite / MySQL) : équivalent portable de ArrayAgg / StringAgg.
+    Sous SQLite, DISTINCT n'est accepté qu'avec le séparateur par défaut.
+    """
+    function = "GROUP_CONCAT"
+    template = "%(function)s(%(distinct)s%(expressions)s, %(separator)s)"
+    allow_distinct = True
+    output_field = CharField()
+
+    def __init__(self, expression, separator=",", **extra):
+        # Littéral SQL et non paramètre : MySQL n'accepte qu'une chaîne après SEPARATOR
+        super().__init__(expression, separator="'%s'" % separator.replace("'", "''"), **extra)
+
+    # Template posé sur une copie et non passé en extra_context : avec filter=,
+    # Aggregate.as_sql transmet déjà template= (TypeError "multiple values")
+    def _with_template(self, template):
+        clone = self.copy()
+        clone.template = template
+        return clone
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        aggregate = self
+        if self.extra["separator"] == "','":
+            aggregate = self._with_template("%(function)s(%(distinct)s%(expressions)s)")
+        return aggregate.as_sql(compiler, connection, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        aggregate = self._with_template("%(function)s(%(distinct)s%(expressions)s SEPARATOR %(separator)s)")
+        return aggregate.as_sql(compiler, connection, **extra_context)
+
+
+def tickets_ko_aggregate(condition):
+    """Liste des mantis vérifiant ``condition``, agrégée dans la même requête."""
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.aggregates import ArrayAgg
+        return ArrayAgg("su_mantis", filter=condition, ordering="su_mantis")
+    return GroupConcat("su_mantis", filter=condition)
+
+
+def parse_tickets(value):
+    """ArrayAgg -> liste (ou None), GroupConcat -> '1,2,3' (ou None)."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return sorted(int(v) for v in value.split(","))
+    return list(value)
+
+
+def get_installations_stats(date_from=None, date_to=None):
+    """
+    Retourne un dictionnaire des installations par mois :
+    {
+        '2025-01': {'ok': 12, 'ko': 3, 'tickets_ko': [1234, 1237, 1240]},
+        '2025-02': {'ok': 9,  'ko': 1, 'tickets_ko': [1302]},
+        ...
+    }
+
+    Une seule requête : les tickets hors délai sont agrégés avec les compteurs.
+
+    :param date_from: (Optionnel) date de livraison minimale (incluse)
+    :param date_to: (Optionnel) date de livraison maximale (exclue)
+    """
+    # Filtrage principal : statuts terminés ou à cartographier
+    queryset = SuiviInstall.objects.filter(
+        su_statut__s_name__in=["Terminé", "Validation à cartographier"],
+        su_delivery_date__isnull=False,
+        su_desired_delivery_date__isnull=False
+    )
+    if date_from is not None:
+        queryset = queryset.filter(su_delivery_date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(su_delivery_date__lt=date_to)
+
+    hors_delai = Q(su_delivery_date__gt=F("su_desired_delivery_date"))
+
+    # Agrégation mensuelle + tickets hors délai
+    stats = (
+        queryset
+        .annotate(month=TruncMonth("su_delivery_date"))
+        .values("month")
+        .annotate(
+            ok=Count("id", filter=Q(su_delivery_date__lte=F("su_desired_delivery_date"))),
+            ko=Count("id", filter=hors_delai),
+            tickets_ko=tickets_ko_aggregate(hors_delai),
+        )
+        .order_by("month")
+    )
+
+    # Transformation en dictionnaire
+    results = {}
+
+    for s in stats:
+        results[s["month"].strftime("%Y-%m")] = {
+            "ok": s["ok"],
+            "ko": s["ko"],
+            "tickets_ko": parse_tickets(s["tickets_ko"]),
+        }
+
+    return results
+
+
+##### Listing des installations
+LISTING_CHUNK_SIZE = 2000
+
+# clé de sortie -> champ / annotation
+LISTING_FIELDS = OrderedDict([
+    ("mantis", "su_mantis"),
+    ("type", "su_type_installation"),
+    ("context", "su_contexte__c_name"),
+    ("statut", "su_statut__s_name"),
+    ("date_livraison_souhaitee", "date_souhaitee"),
+    ("date_livraison_reelle", "date_reelle"),
+    ("nb_lots_connus", "su_nb_known_lot"),
+    ("nb_nouvelle_version", "su_nb_new_version"),
+    ("nb_nouveau_lot", "su_nb_new_lot"),
+    ("lots_version", "lots_version"),
+])
+
+
+def lots_version_aggregate():
+    """'LOT@VERSION, LOT@VERSION, ...' calculé par la base."""
+    lot_at_version = Concat("su_lots__l_name", Value("@"), "su_lots__l_version", output_field=CharField())
+    # Concat remplace NULL par '' : sans ce filtre, une installation sans lot donnerait '@'
+    avec_lot = Q(su_lots__isnull=False)
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.aggregates import StringAgg
+        return StringAgg(lot_at_version, delimiter=", ", filter=avec_lot, ordering="su_lots__l_name")
+    return GroupConcat(lot_at_version, separator=", ", filter=avec_lot)
+
+
+def installations_queryset(queryset=None):
+    """
+    SuiviInstall avec FK jointes et l'annotation ``lots_version``
+    (une seule requête, GROUP BY sur l'installation).
+    """
+    if queryset is None:
+        queryset = SuiviInstall.objects.all()
+    return (
+        queryset
+        .select_related("su_contexte", "su_statut")
+        .annotate(
+            lots_version=lots_version_aggregate(),
+            date_souhaitee=TruncDate("su_desired_delivery_date"),
+            date_reelle=TruncDate("su_delivery_date"),
+        )
+    )
+
+
+def iter_installations_chunks(queryset=None, chunk_size=LISTING_CHUNK_SIZE):
+    """
+    Génère les installations par paquets de ``chunk_size`` dicts
+    (format de l'ancien export Prefetch).
+    """
+    rows = (
+        installations_queryset(queryset)
+        .order_by("-su_reception_date", "id")
+        .values_list(*LISTING_FIELDS.values())
+        .iterator(chunk_size=chunk_size)
+    )
+    keys = list(LISTING_FIELDS)
+
+    chunk = []
+    for values in rows:
+        row = dict(zip(keys, values))
+        row["lots_version"] = row["lots_version"] or ""
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+##### Export XLSX en streaming
+EXPORT_CHUNK_SIZE = 2000
+
+# (en-tête, champ, est une date, largeur)
+EXPORT_MANTIS_COLUMNS = [
+    ("mantis", "su_mantis", False, 10),
+    ("type", "su_type_installation", False, 12),
+    ("coefforth", "su_total_coeff", False, 10),
+    ("contexte", "su_contexte__c_name", False, 14),
+    ("statut_livraison", "su_statut__s_name", False, 20),
+    ("date_livraison_souhaite", "su_desired_delivery_date", True, 18),
+    ("date_prise_en_compte", "su_taken_date", True, 18),
+    ("date_installation", "su_install_date", True, 18),
+    ("date_fin_installation", "su_delivery_date", True, 18),
+    ("nb_lots_connus", "su_nb_known_lot", False, 10),
+    ("nb_nouvelles_versions", "su_nb_new_version", False, 10),
+    ("lots_version", "lots_version", False, 60),
+]
+
+
+def _excel_date(value):
+    """Excel ne gère pas les fuseaux : datetime aware -> heure locale naive."""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def ecrire_export_mantis(fileobj, queryset=None, columns=EXPORT_MANTIS_COLUMNS, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Écrit l'export Mantis dans ``fileobj`` (chemin ou fichier binaire).
+
+    :param queryset: (Optionnel) SuiviInstall à exporter, tous par défaut
+    :param columns: Colonnes (en-tête, champ, date ?, largeur)
+    :param chunk_size: Taille des paquets lus en base
+    """
+    queryset = installations_queryset(queryset).order_by("-su_reception_date", "id")
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Mantis")
+
+    # Styles et largeurs définis une seule fois
+    wb.add_named_style(NamedStyle(name="date_fr", number_format="DD/MM/YYYY HH:MM"))
+    for col_idx, (_header, _field, _is_date, width) in enumerate(columns, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+    ws.append([header for header, _field, _is_date, _width in columns])
+
+    date_idx = [i for i, (_h, _f, is_date, _w) in enumerate(columns) if is_date]
+    fields = [field for _header, field, _is_date, _width in columns]
+
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        row = list(values)
+        for i in date_idx:
+            if row[i] is not None:
+                cell = WriteOnlyCell(ws, value=_excel_date(row[i]))
+                cell.style = "date_fr"
+                row[i] = cell
+        ws.append(row)
+
+    wb.save(fileobj)
+
+
+##### Installations + lots en JSON
+INSTALL_FIELDS = [
+    'id',
+    'su_mantis',
+    'su_description',
+    'su_priorite',
+    'su_type_installation',
+    'su_total_coeff',
+    'su_contexte',
+    'su_reception_date',
+    'su_taken_date',
+    'su_statut',
+    'su_analyse_date',
+    'su_is_lisa_smi',
+    'su_standby_date',
+    'su_test_date',
+    'su_desired_delivery_date',
+    'su_delivery_date',
+    'su_main_penv_user',
+    'su_other_penv_user',
+    'su_commentary',
+    'su_nb_known_lot',
+    'su_nb_new_version',
+    'su_nb_new_lot',
+    'su_is_manually_modified',
+    'su_nb_artefacts',
+    'su_nb_artefact_maj',
+]
+
+
+def latest_lot_versions(installs=None):
+    """
+    Dernière SuiviLotVersion (plus grand id) par (lot, mantis), en 1 requête.
+
+    :param installs: (Optionnel) queryset SuiviInstall pour restreindre les mantis
+    :return: {(lot_id, mantis): (id, is_new_lot, artefact_number, previous_lot_id)}
+    """
+    queryset = SuiviLotVersion.objects.all()
+    if installs is not None:
+        queryset = queryset.filter(si_installation_mantis__in=installs.values('su_mantis'))
+
+    if connection.vendor == 'postgresql':
+        queryset = (
+            queryset
+            .order_by('si_lot_id', 'si_installation_mantis', '-id')
+            .distinct('si_lot_id', 'si_installation_mantis')
+        )
+    else:
+        derniers = (
+            queryset
+            .values('si_lot_id', 'si_installation_mantis')
+            .annotate(dernier_id=Max('id'))
+            .values('dernier_id')
+        )
+        queryset = SuiviLotVersion.objects.filter(id__in=derniers)
+
+    return {
+        (lot_id, mantis): (version_id, is_new_lot, artefact_number, previous_lot_id)
+        for version_id, lot_id, mantis, is_new_lot, artefact_number, previous_lot_id in queryset.values_list(
+            'id',
+            'si_lot_id',
+            'si_installation_mantis',
+            'si_is_new_lot',
+            'si_updated_artefact_number',
+            'si_precedent',
+        )
+    }
+
+
+def get_installations_with_lots(queryset=None):
+    """
+    Installations + lots (même structure que get_installations_with_lots_json),
+    en 2 requêtes quel que soit le volume.
+    """
+    if queryset is None:
+        queryset = SuiviInstall.objects.all()
+
+    versions = latest_lot_versions(queryset)
+    rows = (
+        queryset
+        .order_by('-su_reception_date')
+        .values_list(*INSTALL_FIELDS, 'su_lots__id', 'su_lots__l_name', 'su_lots__l_version')
+    )
+
+    installations = {}
+    nb = len(INSTALL_FIELDS)
+
+    for r in rows:
+        inst_id = r[0]
+        inst = installations.get(inst_id)
+
+        if inst is None:
+            # 'su_mantis' -> 'mantis', 'su_reception_date' -> 'reception_date', ...
+            inst = {field[3:] if field.startswith('su_') else field: value
+                    for field, value in zip(INSTALL_FIELDS, r[:nb])}
+            inst["lots"] = []
+            installations[inst_id] = inst
+
+        lot_id, lot_name, lot_version = r[nb:]
+        version_id, is_new_lot, artefact_number, previous_lot_id = versions.get(
+            (lot_id, inst["mantis"]), (None, None, None, None)
+        )
+
+        inst["lots"].append({
+            "id": lot_id,
+            "name": lot_name,
+            "version": lot_version,
+            "version_id": version_id,
+            "is_new_lot": is_new_lot,
+            # Nouvelle version = pas un nouveau lot
+            "is_new_version": is_new_lot is False,
+            "artefact_number": artefact_number,
+            "previous_lot_id": previous_lot_id,
+        })
+
+    return list(installations.values())
+
+
+def get_installations_with_lots_json():
+    installations = get_installations_with_lots()
+    with timed("serialize"):
+        return json.dumps(installations, default=str, separators=(",", ":"))